@@ -0,0 +1,63 @@
+"""
+导入耗时基准：在新的解释器中多次导入模块，统计中位耗时
+
+用法：
+    python benchmarks/import_time.py [模块 ...] [--repeat N] [--budget 毫秒]
+
+超过 --budget 时以非零状态退出，可用于检查启动开销是否回退
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 不应在导入时加载的重量级依赖
+HEAVY_MODULES = ['multiprocess', 'dill', 'more_itertools', 'multipledispatch']
+
+_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(','.join(m for m in %r if m in sys.modules))
+'''
+
+
+def measure(module: str, repeat: int):
+    """返回 (每次导入耗时列表（秒）, 被连带导入的重量级依赖)"""
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', _SCRIPT % (module, HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.splitlines()
+        timings.append(float(output[0]))
+        loaded = [m for m in output[1].split(',') if m]
+    return timings, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量模块导入耗时')
+    parser.add_argument('modules', nargs='*', default=['mp', 'pb', 'logger', 'ds'])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=None, help='中位耗时上限（毫秒）')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        timings, loaded = measure(module, args.repeat)
+        median = statistics.median(timings) * 1000
+        print('%-10s median %7.2fms  min %7.2fms  heavy: %s' % (
+            module, median, min(timings) * 1000, ', '.join(loaded) or '-'))
+        if args.budget is not None and median > args.budget:
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
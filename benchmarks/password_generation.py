@@ -0,0 +1,68 @@
+"""
+批量生成密码的吞吐量基准：比较逐个生成（random.choices 整串重试）与 password.generate_many
+
+历史写入临时数据库，不影响 password/history.sqlite
+
+用法：
+    python benchmarks/password_generation.py [--count N] [--policy complex]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import password  # noqa: E402
+
+
+def per_item(count, policy):
+    """旧实现：每个密码整串重试直到包含所有字符集，并单独写入一次历史"""
+    length, charsets = password._POLICIES[policy]
+    alphabet = ''.join(charsets)
+    for _ in range(count):
+        chars = ''
+        while not all(set(chars) & set(charset) for charset in charsets):
+            chars = ''.join(random.choices(alphabet, k=length))
+        password._save(policy, chars)
+
+
+def per_item_unsaved(count, policy):
+    length, charsets = password._POLICIES[policy]
+    alphabet = ''.join(charsets)
+    for _ in range(count):
+        chars = ''
+        while not all(set(chars) & set(charset) for charset in charsets):
+            chars = ''.join(random.choices(alphabet, k=length))
+
+
+def batch(count, policy):
+    password.generate_many(count, policy)
+
+
+def batch_unsaved(count, policy):
+    password.generate_many(count, policy, save=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量批量生成密码的吞吐量')
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--policy', default='complex', choices=list(password._POLICIES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        password._HISTORY_PATH = os.path.join(directory, 'history.sqlite')
+        for case in [per_item_unsaved, batch_unsaved, per_item, batch]:
+            # 逐个写入历史很慢，只测量一部分
+            count = args.count // 20 if case is per_item else args.count
+            start = perf_counter()
+            case(count, args.policy)
+            elapsed = perf_counter() - start
+            print('%-18s %10.0f passwords/s' % (case.__name__, count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+进度条迭代开销基准：比较裸 for 循环与 pb 封装后每个数据的耗时
+
+用法：
+    python benchmarks/pb_iteration.py [--size N] [--repeat N]
+"""
+
+import argparse
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pb import ProgressBar  # noqa: E402
+
+
+def bare(data):
+    for _ in data:
+        pass
+
+
+def sampled(data):
+    for _ in ProgressBar('sampled')(data):
+        pass
+
+
+def sampled_background(data):
+    for _ in ProgressBar('background', fps=ProgressBar.DEFAULT_FPS)(data):
+        pass
+
+
+def fixed_interval(data):
+    for _ in ProgressBar('fixed')(data, interval=1):
+        pass
+
+
+def unsized(data):
+    for _ in ProgressBar('unsized')(iter(data)):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量 pb 封装迭代器的开销')
+    parser.add_argument('--size', type=int, default=5_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data = range(args.size)
+    baseline = None
+    for case in [bare, sampled, sampled_background, unsized, fixed_interval]:
+        best = float('inf')
+        for _ in range(args.repeat):
+            # 进度条输出不计入终端，只测量格式化与迭代本身
+            with redirect_stdout(io.StringIO()):
+                start = perf_counter()
+                case(data)
+                best = min(best, perf_counter() - start)
+        per_item = best / args.size * 1e9
+        baseline = baseline or per_item
+        print('%-20s %8.2fns/item  %6.2fx' % (case.__name__, per_item, per_item / baseline))
+
+
+if __name__ == '__main__':
+    main()
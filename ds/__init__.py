@@ -2,8 +2,10 @@
 数据结构
 """
 
+from .compact import CompactMerge
 from .dict import Merge
 
 __all__ = [
     'Merge',
+    'CompactMerge',
 ]
@@ -0,0 +1,241 @@
+"""紧凑存储的 Merge"""
+
+import mmap
+import pickle
+import struct
+from array import array
+from collections.abc import Mapping
+from itertools import accumulate, chain
+
+from .dict import Merge, _is_numpy
+
+# 文件格式：文件头、偏移（int64，键数 + 1 个）、值、pickle 的键列表
+_MAGIC = b'CMERGE1\0'
+_HEADER = struct.Struct('<8sc7xQQQ')
+
+
+def _extend(values, segment):
+    """将同类型的一段缓冲区（memoryview、array、NumPy 数组）按字节追加到 array 末尾"""
+    values.frombytes(memoryview(segment).cast('B'))
+
+
+class CompactMerge(Mapping):
+    """
+    与 Merge(ctype=list) 相同的分组，但所有值连续保存在一个定长类型的数组中（CSR 格式），
+    另用偏移数组记录每个键对应的区间。每个值只占 itemsize 字节，而不是一个 Python 对象
+
+    取值返回对应区间的 memoryview（NumPy 数组时为视图），不复制数据
+    """
+
+    def __init__(self, key_iter=(), value_iter=None, typecode='q'):
+        """
+        构建方法同 Merge：
+            CompactMerge({1: [2, 3]}) => {1: [2, 3]}
+
+            CompactMerge([(1, 2), (1, 3)]) => {1: [2, 3]}
+
+            CompactMerge([1, 1], [2, 3]) => {1: [2, 3]}
+
+        typecode 为 array 模块的类型代码，默认 'q'（int64）
+        键与值都是 NumPy 数组时，排序后直接得到分组，值保存为 NumPy 数组
+        """
+        self._mmap = None
+        if value_iter is None and isinstance(key_iter, Mapping):
+            keys = list(key_iter)
+            values = array(typecode)
+            for key in keys:
+                values.extend(key_iter[key])
+            offsets = array('q', accumulate(chain([0], (len(key_iter[key]) for key in keys))))
+        elif value_iter is not None and _is_numpy(key_iter) and _is_numpy(value_iter):
+            keys, offsets, values = self._group_numpy(key_iter, value_iter)
+            typecode = values.dtype.char
+        else:
+            if value_iter is None:
+                kv_iter = key_iter
+            else:
+                kv_iter = zip(key_iter, value_iter)
+            keys, offsets, values = self._group(kv_iter, typecode)
+        self._set(keys, offsets, values, typecode)
+
+    def _set(self, keys, offsets, values, typecode):
+        self._keys = keys
+        self._index = {key: i for i, key in enumerate(keys)}
+        self.offsets = offsets
+        self.values = values
+        self.typecode = typecode
+        self._numpy = _is_numpy(values)
+        # 取值时切片的对象：array 切片会复制，因此使用 memoryview
+        self._view = memoryview(values) if isinstance(values, array) else values
+
+    @classmethod
+    def _from_parts(cls, keys, offsets, values, typecode):
+        result = cls.__new__(cls)
+        result._mmap = None
+        result._set(keys, offsets, values, typecode)
+        return result
+
+    @staticmethod
+    def _group(kv_iter, typecode):
+        """
+        第一遍只追加到两个定长数组（值、键的序号），再按序号计数排序，数据不会经过 Python list
+        """
+        index = {}
+        keys = []
+        slots = array('q')
+        values = array(typecode)
+        for key, value in kv_iter:
+            slot = index.get(key)
+            if slot is None:
+                slot = index[key] = len(keys)
+                keys.append(key)
+            slots.append(slot)
+            values.append(value)
+        counts = [0] * (len(keys) + 1)
+        for slot in slots:
+            counts[slot + 1] += 1
+        offsets = array('q', accumulate(counts))
+        if all(slots[i] <= slots[i + 1] for i in range(len(slots) - 1)):
+            # 同一个键的值已经连续
+            return keys, offsets, values
+        positions = offsets[:-1]
+        grouped = array(typecode, [0]) * len(values)
+        for slot, value in zip(slots, values):
+            grouped[positions[slot]] = value
+            positions[slot] += 1
+        return keys, offsets, grouped
+
+    @staticmethod
+    def _group_numpy(keys, values):
+        import numpy as np
+
+        if len(keys) != len(values):
+            raise ValueError('keys and values have different lengths: %d, %d' % (len(keys), len(values)))
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.zeros(0, np.int64)
+        offsets = np.append(starts, len(keys)).astype(np.int64)
+        return keys[starts].tolist(), offsets, values[order]
+
+    def __getitem__(self, key):
+        i = self._index[key]
+        return self._view[self.offsets[i]:self.offsets[i + 1]]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return '%s({%s})' % (type(self).__name__, ', '.join('%r: %r' % (key, self[key].tolist()) for key in self._keys))
+
+    @property
+    def size(self):
+        """值的总数"""
+        return len(self.values)
+
+    def to_merge(self, ctype=list):
+        """转换为普通的 Merge"""
+        return Merge({key: self[key].tolist() for key in self._keys}, ctype=ctype)
+
+    def _segment(self, other, key):
+        """other 中 key 对应的值，转换为与自身相同类型的缓冲区"""
+        if isinstance(other, CompactMerge) and other.typecode == self.typecode:
+            return other[key]
+        return array(self.typecode, other[key])
+
+    def __add__(self, other):
+        if not isinstance(other, Mapping):
+            raise TypeError(
+                "unsupported operand type(s) for +: '%s' and '%s'" % (type(self), type(other)))
+        keys = self._keys + [key for key in other if key not in self._index]
+        values = array(self.typecode)
+        offsets = array('q', [0])
+        for key in keys:
+            if key in self._index:
+                _extend(values, self[key])
+            if key in other:
+                _extend(values, self._segment(other, key))
+            offsets.append(len(values))
+        return self._wrap(keys, offsets, values)
+
+    def __sub__(self, other):
+        """每个键去掉 other 中对应的值"""
+        if not isinstance(other, Mapping):
+            raise TypeError(
+                "unsupported operand type(s) for -: '%s' and '%s'" % (type(self), type(other)))
+        values = array(self.typecode)
+        offsets = array('q', [0])
+        for key in self._keys:
+            if key in other:
+                removed = set(self._segment(other, key).tolist())
+                values.extend(value for value in self[key].tolist() if value not in removed)
+            else:
+                _extend(values, self[key])
+            offsets.append(len(values))
+        return self._wrap(list(self._keys), offsets, values)
+
+    def _wrap(self, keys, offsets, values):
+        """运算结果保存在内存中；自身使用 NumPy 时结果也使用 NumPy"""
+        if self._numpy:
+            import numpy as np
+            offsets, values = np.frombuffer(offsets, np.int64), np.frombuffer(values, self.typecode)
+        return self._from_parts(keys, offsets, values, self.typecode)
+
+    def save(self, path):
+        """
+        写入文件，之后可以用 CompactMerge.open 以内存映射的方式打开
+        """
+        keys = pickle.dumps(self._keys, pickle.HIGHEST_PROTOCOL)
+        with open(path, 'wb') as file:
+            file.write(_HEADER.pack(_MAGIC, self.typecode.encode(), len(self._keys), len(self.values), len(keys)))
+            file.write(memoryview(self.offsets).cast('B'))
+            file.write(memoryview(self.values).cast('B'))
+            file.write(keys)
+
+    @classmethod
+    def open(cls, path, numpy=False):
+        """
+        以内存映射的方式打开 save 写入的文件：只读取键，值在访问时才由系统从文件中载入
+
+        Arguments:
+            numpy: bool = False
+                值以 NumPy 数组的形式返回
+        """
+        with open(path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, typecode, key_count, value_count, key_bytes = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            data.close()
+            raise ValueError('not a CompactMerge file: %r' % path)
+        typecode = typecode.decode()
+        itemsize = array(typecode).itemsize
+        offsets_start = _HEADER.size
+        values_start = offsets_start + (key_count + 1) * 8
+        keys_start = values_start + value_count * itemsize
+        keys = pickle.loads(data[keys_start:keys_start + key_bytes])
+        if numpy:
+            import numpy as np
+            offsets = np.frombuffer(data, np.int64, key_count + 1, offsets_start)
+            values = np.frombuffer(data, typecode, value_count, values_start)
+        else:
+            view = memoryview(data)
+            offsets = view[offsets_start:values_start].cast('q')
+            values = view[values_start:keys_start].cast(typecode)
+        result = cls._from_parts(keys, offsets, values, typecode)
+        result._mmap = data
+        return result
+
+    def __getstate__(self):
+        # 文件映射或 NumPy 的数据转换为 array 传递
+        offsets, values = array('q'), array(self.typecode)
+        _extend(offsets, self.offsets)
+        _extend(values, self.values)
+        return self._keys, offsets, values, self.typecode
+
+    def __setstate__(self, state):
+        self._mmap = None
+        self._set(*state)
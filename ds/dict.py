@@ -1,5 +1,97 @@
 """字典类"""
 
+from collections import Counter
+
+# 数值归约：同一个键的值直接累积为一个数，不保存所有值
+_REDUCTIONS = {
+    sum: lambda a, b: a + b,
+    min: min,
+    max: max,
+}
+# NumPy 中对应的分组归约
+_NUMPY_REDUCTIONS = {
+    sum: 'add',
+    min: 'minimum',
+    max: 'maximum',
+}
+
+
+def _accumulate(data, kv_iter, ctype):
+    """
+    将键值对逐个加入 data，按 ctype 原生地累积（append、add、计数、归约），只遍历一次
+    其他 ctype 先收集为 list，最后再转换
+    """
+    get = data.get
+    if ctype is set:
+        for k, v in kv_iter:
+            collection = get(k)
+            if collection is None:
+                data[k] = {v}
+            else:
+                collection.add(v)
+    elif ctype is Counter:
+        for k, v in kv_iter:
+            collection = get(k)
+            if collection is None:
+                data[k] = Counter((v,))
+            else:
+                collection[v] += 1
+    elif ctype in _REDUCTIONS:
+        if ctype is sum:
+            for k, v in kv_iter:
+                data[k] = data[k] + v if k in data else v
+        else:
+            reduce = _REDUCTIONS[ctype]
+            for k, v in kv_iter:
+                data[k] = reduce(data[k], v) if k in data else v
+    else:
+        converted = ctype is not list
+        if converted:
+            # 已经转换过的值先还原为 list，以便继续 append
+            for k in data:
+                data[k] = list(data[k])
+        for k, v in kv_iter:
+            collection = get(k)
+            if collection is None:
+                data[k] = [v]
+            else:
+                collection.append(v)
+        if converted:
+            for k, v in data.items():
+                data[k] = ctype(v)
+    return data
+
+
+def _is_numpy(array):
+    # 不导入 numpy，只根据类型判断
+    return type(array).__module__ == 'numpy' and type(array).__name__ == 'ndarray'
+
+
+def _group_numpy(keys, values, ctype):
+    """
+    对平行的键、值数组排序后按段分组，归约与转换都以整段为单位进行
+    """
+    import numpy as np
+
+    if len(keys) != len(values):
+        raise ValueError('keys and values have different lengths: %d, %d' % (len(keys), len(values)))
+    if not len(keys):
+        return {}
+    # 归约与顺序无关，不需要稳定排序
+    order = np.argsort(keys, kind=None if ctype in _NUMPY_REDUCTIONS else 'stable')
+    keys = keys[order]
+    values = values[order]
+    boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    unique_keys = keys[starts].tolist()
+    if ctype in _NUMPY_REDUCTIONS:
+        reduced = getattr(np, _NUMPY_REDUCTIONS[ctype]).reduceat(values, starts)
+        return dict(zip(unique_keys, reduced.tolist()))
+    segments = np.split(values, boundaries)
+    if ctype is list:
+        return {k: segment.tolist() for k, segment in zip(unique_keys, segments)}
+    return {k: ctype(segment.tolist()) for k, segment in zip(unique_keys, segments)}
+
 
 class Merge(dict):
     """将同样键的值用某种 collection 来保存"""
@@ -14,72 +106,123 @@ class Merge(dict):
             Merge([1, 1], [2, 3]) => {1: [2, 3]}
 
             Merge([1, 1], [2, 3], ctype=set) => {1: {2, 3}}
-        """
-        data = {}
 
+        list、set、collections.Counter 直接在遍历时累积；ctype 也可以是 sum、min、max，
+        此时每个键只保存归约后的数值：
+            Merge([1, 1], [2, 3], ctype=sum) => {1: 5}
+
+            Merge([1, 1], [2, 2], ctype=Counter) => {1: Counter({2: 2})}
+
+        键与值都是 NumPy 数组时，排序后按段分组，不逐个遍历数据
+        """
         if value_iter is None and isinstance(key_iter, dict):
-            data = key_iter
+            if ctype in _REDUCTIONS:
+                # 归约的值已经是数值
+                data = dict(key_iter)
+            else:
+                data = {k: ctype(v) for k, v in key_iter.items()}
+        elif value_iter is not None and _is_numpy(key_iter) and _is_numpy(value_iter):
+            data = _group_numpy(key_iter, value_iter, ctype)
         else:
             if value_iter is None:
                 kv_iter = key_iter
             else:
                 kv_iter = zip(key_iter, value_iter)
-
-            for k, v in kv_iter:
-                if k in data:
-                    data[k].append(v)
-                else:
-                    data[k] = [v]
-
-        data = {k: ctype(v) for k, v in data.items()}
+            data = _accumulate({}, kv_iter, ctype)
 
         super().__init__(data)
         self.ctype = ctype
 
-    def __add__(self, other):
-        if not hasattr(self.ctype, '__add__') and not issubclass(self.ctype, set):
+    def _check(self, other, operator):
+        if not isinstance(other, dict):
             raise TypeError(
-                "collection type '%s' does not support +" % self.ctype)
-        if isinstance(other, dict):
-            self_keys = set(self)
-            other_keys = set(other)
-            result = {}
-
-            for key in self_keys - other_keys:
-                a = result[key] = self[key]
-                assert isinstance(a, self.ctype)
-            for key in other_keys - self_keys:
-                a = result[key] = other[key]
-                assert isinstance(a, self.ctype)
-            for key in self_keys & other_keys:
-                assert isinstance(self[key], self.ctype) and isinstance(
-                    other[key], self.ctype)
-                if issubclass(self.ctype, set):
-                    result[key] = self[key] | other[key]
-                else:
-                    result[key] = self[key] + other[key]
-            return Merge(result, ctype=self.ctype)
+                "unsupported operand type(s) for %s: '%s' and '%s'" % (operator, type(self), type(other)))
+        if operator == '+':
+            supported = self.ctype in _REDUCTIONS or hasattr(self.ctype, '__add__') or issubclass(self.ctype, set)
         else:
+            supported = self.ctype is sum or self.ctype not in _REDUCTIONS and hasattr(self.ctype, '__sub__')
+        if not supported:
             raise TypeError(
-                "unsupported operand type(s) for +: '%s' and '%s'" % (type(self), type(other)))
+                "collection type '%s' does not support %s" % (self.ctype, operator))
+
+    def __iadd__(self, other):
+        """
+        原地合并：共有的键就地扩展（list.extend、set.update、Counter.update、归约），
+        只出现在 other 中的键复制一次，不重新构建整个 Merge
+        """
+        self._check(other, '+')
+        ctype = self.ctype
+        get = dict.get
+        if ctype is list or ctype is set or ctype is Counter:
+            extend = {list: list.extend, set: set.update, Counter: Counter.update}[ctype]
+            for key, value in other.items():
+                collection = get(self, key)
+                if collection is None:
+                    self[key] = ctype(value)
+                else:
+                    extend(collection, value)
+        elif ctype in _REDUCTIONS:
+            reduce = _REDUCTIONS[ctype]
+            for key, value in other.items():
+                self[key] = reduce(self[key], value) if key in self else value
+        else:
+            for key, value in other.items():
+                collection = get(self, key)
+                if collection is None:
+                    self[key] = ctype(value)
+                elif issubclass(ctype, set):
+                    self[key] = collection | value
+                else:
+                    self[key] = collection + value
+        return self
+
+    def __isub__(self, other):
+        """原地相减：只处理共有的键"""
+        self._check(other, '-')
+        for key, value in other.items():
+            if key in self:
+                collection = self[key]
+                collection -= value
+                # set、Counter 在原地修改，数值与其他类型得到新的对象
+                self[key] = collection
+        return self
+
+    def __add__(self, other):
+        self._check(other, '+')
+        result = Merge({}, ctype=self.ctype)
+        result += self
+        result += other
+        return result
 
     def __sub__(self, other):
-        if not hasattr(self.ctype, '__sub__'):
-            raise TypeError(
-                "collection type '%s' does not support -" % self.ctype)
+        self._check(other, '-')
+        result = Merge({}, ctype=self.ctype)
+        result += self
+        result -= other
+        return result
+
+    def update(self, other):
+        """
+        原地加入另一个 Merge / dict（同 +=），或一组 (键, 值)（同构建时的累积方式）
+        """
         if isinstance(other, dict):
-            self_keys = set(self)
-            other_keys = set(other)
-            result = {}
-
-            for key in self_keys - other_keys:
-                a = result[key] = self[key]
-                assert isinstance(a, self.ctype)
-            for key in self_keys & other_keys:
-                assert isinstance(self[key], self.ctype) and isinstance(
-                    other[key], self.ctype)
-                result[key] = self[key] - other[key]
-            return Merge(result, ctype=self.ctype)
+            self += other
         else:
-            raise TypeError(
-                "unsupported operand type(s) for -: '%s' and '%s'" % (type(self), type(other)))
+            _accumulate(self, other, self.ctype)
+
+    @classmethod
+    def merge_all(cls, merges, ctype=None):
+        """
+        将多个 Merge 一次合并为一个新的 Merge，每个值只复制一次：
+            Merge.merge_all([Merge([1], [2]), Merge([1], [3])]) => {1: [2, 3]}
+
+        ctype 默认使用第一个 Merge 的 ctype
+        """
+        result = None
+        for merge in merges:
+            if result is None:
+                result = cls({}, ctype=ctype or getattr(merge, 'ctype', list))
+            result += merge
+        if result is None:
+            result = cls({}, ctype=ctype or list)
+        return result
@@ -1,6 +1,29 @@
 """检查运行环境"""
 
+import sys
+
+
 def interactive() -> bool:
-    """是否运行于 Python 交互环境"""
+    """是否运行于 Python 交互环境（REPL、IPython、Jupyter）"""
     import __main__ as main
-    return hasattr(main, '__file__')
+    return not hasattr(main, '__file__') or hasattr(sys, 'ps1') or _ipython()
+
+
+def _ipython() -> bool:
+    """IPython 会在 builtins 中注入 get_ipython"""
+    import builtins
+    return hasattr(builtins, 'get_ipython')
+
+
+def tty(stream=None) -> bool:
+    """输出流（默认为 sys.stdout）是否连接到终端"""
+    stream = sys.stdout if stream is None else stream
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+def live_output(stream=None) -> bool:
+    """输出流能否刷新同一行（\\r、光标移动），否则应输出结构化记录"""
+    return tty(stream) or interactive()
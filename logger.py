@@ -2,10 +2,17 @@
 日志记录
 """
 
-import datetime
+import atexit
+import json
 import os
+import re
+import struct
 import sys
+import threading
+import time
+from collections import deque
 
+import tracing
 from styles import *
 
 _print = print
@@ -25,6 +32,8 @@ COLORS = [dim, lambda x: x, yellow, red, bgred + white]
 CWD = os.getcwd()
 # 已完成初始化
 INITIALIZED = False
+# 所有已开启输出中的最低级别，由 _update_min_level 计算
+_min_level = 0
 
 # 配置
 CONFIG = {
@@ -34,6 +43,15 @@ CONFIG = {
         'level': 0,
         'colored': False,
         'file': None,
+        # 轮转：超过 max_bytes 字节或打开超过 interval 秒后轮转，保留最近 backups 个文件
+        'max_bytes': None,
+        'interval': None,
+        'backups': 5,
+        # 轮转后的文件在后台线程中压缩：'gzip'、'zstd'（需要 zstandard）或 None
+        'compress': 'gzip',
+        # 当前文件的字节数与打开时间，由轮转逻辑维护
+        'bytes': 0,
+        'opened': None,
     },
     'warning': {
         'enabled': True,
@@ -41,6 +59,27 @@ CONFIG = {
         'level': 2,
         'colored': False,
         'file': None,
+        # 轮转：超过 max_bytes 字节或打开超过 interval 秒后轮转，保留最近 backups 个文件
+        'max_bytes': None,
+        'interval': None,
+        'backups': 5,
+        # 轮转后的文件在后台线程中压缩：'gzip'、'zstd'（需要 zstandard）或 None
+        'compress': 'gzip',
+        # 当前文件的字节数与打开时间，由轮转逻辑维护
+        'bytes': 0,
+        'opened': None,
+    },
+    # 结构化输出：每条日志一行 JSON，并维护 文件名.idx 稀疏索引，供 query 按时间与级别快速查找
+    'structured': {
+        'enabled': False,
+        'filename': 'log.jsonl',
+        'level': 0,
+        'file': None,
+        # 每写入约 index_every 字节记录一条索引
+        'index_every': 1 << 16,
+        # 索引文件与当前未写入索引的块：起始位置、字节数、时间范围、出现过的级别
+        'index': None,
+        'block': None,
     },
     'stdout': {
         'enabled': True,
@@ -60,11 +99,14 @@ CONFIG = {
 def init(path=None, **kwargs):
     """
     进行配置。调用时会在所有输出打印分割线
+    参数名为 输出_属性，例如 stdout_level=1、trivial_max_bytes=10 << 20、warning_interval=86400
+    文件的轮转在写入时检查，按时间轮转的文件在没有新日志时不会轮转
     """
     # 应用输出配置
     for name, value in kwargs.items():
-        outfile, attribute = name.split('_')
+        outfile, attribute = name.split('_', 1)
         CONFIG[outfile][attribute] = value
+    _update_min_level()
     # 配置输出路径
     global CWD
     if path:
@@ -79,6 +121,9 @@ def init(path=None, **kwargs):
             else:
                 _print('退出程序，请重设日志目录')
                 sys.exit()
+    # 初始化之后才开启的结构化输出
+    if INITIALIZED and CONFIG['structured']['enabled'] and not CONFIG['structured']['file']:
+        _open_structured(CONFIG['structured'])
     # 打印分割线
     if not INITIALIZED:
         width = max(os.get_terminal_size()[0], 10)
@@ -88,6 +133,19 @@ def init(path=None, **kwargs):
         print('-' * width)
 
 
+def _update_min_level():
+    """
+    计算所有已开启输出中的最低级别，低于该级别的日志直接忽略
+    直接修改 CONFIG 后需要调用 init() 使其生效
+    """
+    global _min_level
+    levels = [config['level'] for config in CONFIG.values() if config['enabled']]
+    _min_level = min(levels) if levels else len(LEVELS)
+
+
+_update_min_level()
+
+
 def stdout_only():
     """
     只使用标准输出
@@ -103,56 +161,704 @@ def _maybe_initialize():
     global INITIALIZED
     if not INITIALIZED:
         if CONFIG['trivial']['enabled'] and not CONFIG['trivial']['file']:
-            CONFIG['trivial']['file'] = open(os.path.join(
-                CWD, CONFIG['trivial']['filename']), 'a', encoding='utf-8')
+            _open(CONFIG['trivial'])
         if CONFIG['warning']['enabled'] and not CONFIG['warning']['file']:
-            CONFIG['warning']['file'] = open(os.path.join(
-                CWD, CONFIG['warning']['filename']), 'a', encoding='utf-8')
+            _open(CONFIG['warning'])
+        if CONFIG['structured']['enabled'] and not CONFIG['structured']['file']:
+            _open_structured(CONFIG['structured'])
         INITIALIZED = True
 
 
+def _open(config):
+    """
+    以追加模式打开日志文件
+    """
+    config['file'] = open(os.path.join(CWD, config['filename']), 'a', encoding='utf-8')
+    config['bytes'] = config['file'].tell()
+    config['opened'] = time.time()
+
+
+def _written(config, text):
+    """
+    记录写入文件的内容，达到轮转条件时进行轮转。未配置轮转时不做任何计算
+    """
+    if config['max_bytes'] is None and config['interval'] is None:
+        return
+    config['bytes'] += (len(text) if text.isascii() else len(text.encode('utf-8'))) + 1
+    if config['max_bytes'] is not None and config['bytes'] >= config['max_bytes'] \
+            or config['interval'] is not None and time.time() - config['opened'] >= config['interval']:
+        _rotate(config)
+
+
+def _rotate(config):
+    """
+    将当前文件重命名为 文件名.时间（精确到微秒，按名称排序即按时间排序）并重新打开；
+    压缩与清理旧文件交给后台线程
+    """
+    path = config['file'].name
+    config['file'].close()
+    now = time.time()
+    rotated = base = '%s.%s.%06d' % (path, time.strftime('%Y%m%d-%H%M%S', time.localtime(now)), now % 1 * 1e6)
+    index = 1
+    while any(os.path.exists(rotated + suffix) for suffix in _COMPRESSED_SUFFIXES):
+        rotated = '%s.%d' % (base, index)
+        index += 1
+    os.rename(path, rotated)
+    _open(config)
+    jobs = _compress_queue()
+    with _compress_lock:
+        _compress_pending.add(rotated)
+    jobs.put((rotated, path, config['compress'], config['backups']))
+
+
+# 压缩后的文件后缀
+_COMPRESSED_SUFFIXES = ['', '.gz', '.zst']
+# 轮转后的文件名：文件名.日期-时间.微秒[.序号][.gz|.zst]
+_ROTATED_PATTERN = re.compile(r'\.(\d{8}-\d{6}\.\d{6})(?:\.(\d+))?(?:\.gz|\.zst)?')
+_compress_jobs = None
+_compress_lock = threading.Lock()
+# 已轮转、尚未处理完的文件，清理时跳过
+_compress_pending = set()
+
+
+def _compress_queue():
+    """
+    启动（唯一的）压缩线程，返回其任务队列
+    """
+    global _compress_jobs
+    with _compress_lock:
+        if _compress_jobs is None:
+            import queue
+            _compress_jobs = queue.Queue()
+            threading.Thread(target=_compress_loop, args=(_compress_jobs,), name='logger-compress', daemon=True).start()
+            # 退出时等待进行中的压缩完成，避免留下不完整的文件
+            atexit.register(_compress_jobs.join)
+        return _compress_jobs
+
+
+def _compress_loop(jobs):
+    while True:
+        rotated, path, method, backups = jobs.get()
+        try:
+            try:
+                if method:
+                    _compress(rotated, method)
+            finally:
+                with _compress_lock:
+                    _compress_pending.discard(rotated)
+            _prune(path, backups)
+        except OSError as e:
+            _print('日志轮转失败：%s' % e, file=sys.stderr)
+        finally:
+            jobs.task_done()
+
+
+def _compress(path, method):
+    """
+    压缩文件：先写入临时文件再重命名，最后删除原文件
+    """
+    import shutil
+    if method == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            method = 'gzip'
+    if method == 'zstd':
+        target = path + '.zst'
+        with open(path, 'rb') as src, open(target + '.tmp', 'wb') as dst:
+            zstandard.ZstdCompressor().copy_stream(src, dst)
+    else:
+        import gzip
+        target = path + '.gz'
+        with open(path, 'rb') as src, gzip.open(target + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(target + '.tmp', target)
+    os.remove(path)
+
+
+def _prune(path, backups):
+    """
+    只保留最近 backups 个已经处理完的轮转文件；仍在等待压缩的文件不计入也不删除
+    """
+    directory, name = os.path.split(path)
+    with _compress_lock:
+        pending = set(_compress_pending)
+    rotated = []
+    for entry in os.listdir(directory or '.'):
+        match = entry.startswith(name) and _ROTATED_PATTERN.fullmatch(entry, len(name))
+        full = os.path.join(directory, entry)
+        if match and full not in pending:
+            # 按时间、同一微秒内的序号排序
+            rotated.append(((match.group(1), int(match.group(2) or 0)), full))
+    rotated.sort()
+    for _, old in rotated[:max(0, len(rotated) - backups)]:
+        os.remove(old)
+
+
+# 转义为 ASCII 的 JSON 字符串
+from json.encoder import encode_basestring_ascii as _json_string
+# 索引项：块起始位置、块字节数、块内最早与最晚时间、块内出现过的级别（按位）
+_INDEX_ENTRY = struct.Struct('<QIddI')
+
+
+def _open_structured(config):
+    """
+    以追加模式打开结构化日志与索引。文件末尾尚未写入索引的部分重新读取一次，作为当前块的开头
+    """
+    path = os.path.join(CWD, config['filename'])
+    config['file'] = open(path, 'a', encoding='ascii')
+    config['index'] = open(path + '.idx', 'ab')
+    start = 0
+    if config['index'].tell() >= _INDEX_ENTRY.size:
+        with open(path + '.idx', 'rb') as index:
+            index.seek(config['index'].tell() // _INDEX_ENTRY.size * _INDEX_ENTRY.size - _INDEX_ENTRY.size)
+            offset, length = _INDEX_ENTRY.unpack(index.read(_INDEX_ENTRY.size))[:2]
+            start = offset + length
+    # [起始位置, 字节数, 最早时间, 最晚时间, 级别]
+    block = config['block'] = [start, 0, float('inf'), float('-inf'), 0]
+    with open(path, 'rb') as file:
+        file.seek(start)
+        for line in file:
+            block[1] += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            block[2] = min(block[2], record['time'])
+            block[3] = max(block[3], record['time'])
+            block[4] |= 1 << record['level']
+
+
+def _write_structured(config, timestamp, level, msg, worker):
+    """
+    写入一行 JSON。使用 ensure_ascii，使字符数即是字节数，无需编码即可得到准确的偏移
+    """
+    if worker is None:
+        line = '{"time": %r, "level": %d, "msg": %s}\n' % (timestamp, level, _json_string(msg))
+    else:
+        line = '{"time": %r, "level": %d, "msg": %s, "worker": %s}\n' % (timestamp, level, _json_string(msg), json.dumps(worker))
+    config['file'].write(line)
+    block = config['block']
+    block[1] += len(line)
+    if timestamp < block[2]:
+        block[2] = timestamp
+    if timestamp > block[3]:
+        block[3] = timestamp
+    block[4] |= 1 << level
+    if block[1] >= config['index_every']:
+        # 先写出数据再写索引，索引指向的内容总是已经在文件中
+        config['file'].flush()
+        config['index'].write(_INDEX_ENTRY.pack(*block))
+        config['index'].flush()
+        config['block'] = [block[0] + block[1], 0, float('inf'), float('-inf'), 0]
+
+
 def print(*args, **kwargs):
     """
     在每个文件打印字符，接口等同于内置 print
     """
-    _maybe_initialize()
-    if CONFIG['trivial']['enabled']:
-        _print(*args, **kwargs, file=CONFIG['trivial']['file'])
-    if CONFIG['warning']['enabled']:
-        _print(*args, **kwargs, file=CONFIG['warning']['file'])
+    queue = _queue
+    if queue is not None:
+        # 与日志相同，输出的是调用时参数的状态
+        _enqueue(queue, (_PRINT, tuple(map(str, args)), kwargs, None))
+    elif _transport is not None:
+        _transport.put((_PRINT, args, kwargs, _worker))
+    else:
+        # 与接收线程、异步写出线程写入同样的文件，同一时间只有一个线程写出（包括轮转）
+        with _write_lock:
+            _maybe_initialize()
+            _write_print(args, kwargs)
+
+
+def _write_print(args, kwargs):
+    started = tracing.start() if tracing.ENABLED else None
+    for name in ('trivial', 'warning'):
+        config = CONFIG[name]
+        if config['enabled']:
+            _print(*args, **kwargs, file=config['file'])
+            if config['max_bytes'] is not None or config['interval'] is not None:
+                _written(config, (kwargs.get('sep') or ' ').join(map(str, args)))
     if CONFIG['stdout']['enabled']:
         _print(*args, **kwargs, file=CONFIG['stdout']['file'])
     elif CONFIG['stderr']['enabled']:
         _print(*args, **kwargs, file=CONFIG['stderr']['file'])
+    if started is not None:
+        tracing.stop(started, 'logger.write', 'logger')
 
 
-def _log(msg, level):
+def _log(msg, level, args=()):
     """
-    输出指定级别的日志
+    输出指定级别的日志。args 非空时，只在通过级别检查后才执行 msg % args
     """
-    _maybe_initialize()
-    message = '[%s] %s: %s' % (time_string(), LEVELS[level], msg)
+    if level < _min_level:
+        return
+    # 只读取一次：synchronous() 可能同时将 _queue 置为 None
+    queue = _queue
+    if queue is not None:
+        # 异步模式开启时已经完成初始化。在调用者线程中格式化，记录的是调用时参数的状态
+        _enqueue(queue, (_LOG, time.time(), level, msg % args if args else msg, (), None))
+    elif _transport is not None:
+        # 参数不一定能够序列化，在 worker 中格式化
+        _transport.put((_LOG, time.time(), level, msg % args if args else msg, (), _worker))
+    else:
+        with _write_lock:
+            _maybe_initialize()
+            _write_log(time.time(), level, msg, args)
+
+
+def _write_log(timestamp, level, msg, args=(), worker=None):
+    started = tracing.start() if tracing.ENABLED else None
+    if args:
+        msg = msg % args
+    if CONFIG['structured']['enabled'] and level >= CONFIG['structured']['level']:
+        _write_structured(CONFIG['structured'], timestamp, level, msg, worker)
+    if worker is None:
+        message = '[%s] %s: %s' % (time_string(timestamp), LEVELS[level], msg)
+    else:
+        message = '[%s] %s: [worker %s] %s' % (time_string(timestamp), LEVELS[level], worker, msg)
     color = [lambda x: x, COLORS[level]]
-    if CONFIG['trivial']['enabled'] and level >= CONFIG['trivial']['level']:
-        _print(color[CONFIG['trivial']['colored']](
-            message), file=CONFIG['trivial']['file'])
-    if CONFIG['warning']['enabled'] and level >= CONFIG['warning']['level']:
-        _print(color[CONFIG['warning']['colored']](
-            message), file=CONFIG['warning']['file'])
+    for name in ('trivial', 'warning'):
+        config = CONFIG[name]
+        if config['enabled'] and level >= config['level']:
+            line = color[config['colored']](message)
+            _print(line, file=config['file'])
+            _written(config, line)
     if CONFIG['stderr']['enabled'] and level >= CONFIG['stderr']['level']:
         _print(color[CONFIG['stderr']['colored']](
             message), file=CONFIG['stderr']['file'])
     elif CONFIG['stdout']['enabled'] and level >= CONFIG['stdout']['level']:
         _print(color[CONFIG['stdout']['colored']](
             message), file=CONFIG['stdout']['file'])
+    if started is not None:
+        tracing.stop(started, 'logger.write', 'logger')
 
 
-def time_string():
-    return str(datetime.datetime.now())[:-3]
+# 时间字符串中到秒为止的部分，每秒只计算一次
+_time_cache = (None, '')
+
+
+def time_string(timestamp=None):
+    """
+    形如 2020-01-01 12:00:00.000 的本地时间，timestamp 为 None 时使用当前时间
+    """
+    global _time_cache
+    if timestamp is None:
+        timestamp = time.time()
+    second = int(timestamp)
+    cached_second, prefix = _time_cache
+    if second != cached_second:
+        prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        _time_cache = (second, prefix)
+    return '%s.%03d' % (prefix, (timestamp - second) * 1000)
+
+
+# 异步模式：日志调用只将格式化后的记录放入队列，由后台线程批量写出
+_LOG, _PRINT = 0, 1
+# 记录队列，None 表示同步模式
+_queue = None
+ASYNC_CONFIG = {
+    # 队列容量
+    'queue_size': 65536,
+    # 队列满时的策略：'block' 等待、'drop' 丢弃、
+    # 'sample' 每 sample_every 条保留 1 条，保留的记录替换队列中最早的一条
+    'policy': 'block',
+    'sample_every': 10,
+    # 后台线程写出的最长间隔（秒）
+    'interval': 0.05,
+}
+# 队列容量，开启异步模式时从 ASYNC_CONFIG 读取
+_capacity = 0
+# 因队列已满被丢弃的记录数量
+_dropped = 0
+_full_count = 0
+_writer = None
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_space = threading.Condition()
+# 写出文件（包括轮转）时持有：同步调用、异步写出线程、多进程的接收线程共用
+_write_lock = threading.Lock()
+
+
+def asynchronous(**kwargs):
+    """
+    开启异步模式，参数见 ASYNC_CONFIG
+    程序退出时会写出队列中剩余的所有记录；也可以调用 flush() 立即写出
+    """
+    global _queue, _writer, _capacity
+    for name, value in kwargs.items():
+        if name not in ASYNC_CONFIG:
+            raise TypeError("asynchronous() got an unexpected keyword argument '%s'" % name)
+        ASYNC_CONFIG[name] = value
+    if ASYNC_CONFIG['policy'] not in ('block', 'drop', 'sample'):
+        raise ValueError("unknown policy '%s'" % ASYNC_CONFIG['policy'])
+    _capacity = ASYNC_CONFIG['queue_size']
+    _maybe_initialize()
+    if _queue is None:
+        _queue = deque()
+        _stopping.clear()
+        _writer = threading.Thread(target=_write_loop, name='logger-writer', daemon=True)
+        _writer.start()
+
+
+def synchronous():
+    """
+    写出队列中的记录并关闭异步模式
+    """
+    global _queue, _writer
+    queue = _queue
+    if queue is None:
+        return
+    # 之后的调用直接写出；已经取得队列的调用仍会放入 queue，由下面的 _drain 写出
+    _queue = None
+    _stopping.set()
+    _wakeup.set()
+    _writer.join()
+    _writer = None
+    _drain(queue)
+
+
+def flush():
+    """
+    立即写出异步队列中的所有记录
+    """
+    queue = _queue
+    if queue is not None:
+        _drain(queue)
+
+
+def _enqueue(queue, record):
+    """
+    将记录放入队列，队列满时按策略处理
+    """
+    global _dropped, _full_count
+    if len(queue) < _capacity:
+        queue.append(record)
+        return
+    policy = ASYNC_CONFIG['policy']
+    if policy == 'drop':
+        _dropped += 1
+        return
+    if policy == 'sample':
+        _full_count += 1
+        _dropped += 1
+        if _full_count % ASYNC_CONFIG['sample_every']:
+            return
+        # 替换最早的一条，队列长度不超过容量
+        try:
+            queue.popleft()
+        except IndexError:
+            pass
+    else:
+        with _space:
+            while len(queue) >= _capacity and _writer is not None:
+                _wakeup.set()
+                _space.wait(ASYNC_CONFIG['interval'])
+    queue.append(record)
+
+
+def _drain(queue):
+    """
+    写出开始时队列中已有的记录，每批结束后 flush 一次。之后放入的记录留给下一批，
+    因此其他线程持续写日志时 flush() 与 synchronous() 也能返回
+    """
+    global _dropped
+    with _write_lock:
+        for _ in range(len(queue)):
+            try:
+                record = queue.popleft()
+            except IndexError:
+                # 'sample' 策略的替换可能使队列变短
+                break
+            _write_record(record)
+        if _dropped:
+            dropped, _dropped = _dropped, 0
+            _write_log(time.time(), 2, '日志队列已满，丢弃了 %d 条记录' % dropped)
+        for config in CONFIG.values():
+            if config['enabled'] and config['file'] is not None:
+                config['file'].flush()
+    with _space:
+        _space.notify_all()
+
+
+def _write_record(record):
+    """
+    写出一条队列中的记录：(_LOG, 时间戳, 级别, 消息, 参数, worker) 或 (_PRINT, args, kwargs, worker)
+    """
+    try:
+        if record[0] == _LOG:
+            _write_log(record[1], record[2], record[3], record[4], record[5])
+        elif record[3] is None:
+            _write_print(record[1], record[2])
+        else:
+            _write_print(('[worker %s]' % record[3],) + tuple(record[1]), record[2])
+    except Exception as e:
+        _write_failed(record, e)
+
+
+def _write_failed(record, error):
+    """
+    记录无法写出（如 msg % args 出错、文件无法打开）时，改为写出包含原始内容的一行，不影响之后的记录
+    """
+    reason = '%s: %s' % (type(error).__name__, error)
+    try:
+        if record[0] == _LOG:
+            _write_log(record[1], record[2], '日志写出失败（%s）：%r %% %r' % (reason, record[3], record[4]), worker=record[5])
+        else:
+            _print('输出失败（%s）：%r' % (reason, record[1]), file=sys.stderr)
+    except Exception:
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+
+
+def _write_loop():
+    """
+    后台线程：定期批量写出。写出出错（如磁盘已满）时只报告错误，线程继续运行，
+    否则 'block' 策略下的调用会一直等待
+    """
+    while not _stopping.is_set():
+        _wakeup.wait(ASYNC_CONFIG['interval'])
+        _wakeup.clear()
+        try:
+            queue = _queue
+            if queue is not None:
+                _drain(queue)
+        except Exception:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+
+
+def _flush_files():
+    """
+    程序退出时写出文件缓冲区（轮转后重新打开的文件不保证在解释器退出时被写出）
+    """
+    with _write_lock:
+        for config in CONFIG.values():
+            for name in ('file', 'index'):
+                if config.get(name) is not None and not config[name].closed:
+                    config[name].flush()
+
+
+# atexit 按注册的相反顺序执行：先写出异步队列，再写出文件缓冲区
+atexit.register(_flush_files)
+atexit.register(synchronous)
+
+
+# 多进程：worker 中的日志通过队列发送给主进程中唯一的写出线程，不在 worker 中打开文件
+# worker 中：发送记录的队列与 worker 编号
+_transport = None
+_worker = None
+# 主进程中：接收记录的队列与线程
+_inbox = None
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def forward(queue, worker=None):
+    """
+    在 worker 进程中调用：之后的日志都发送到 queue，由主进程写出，并标注 worker 编号
+    """
+    global _transport, _worker, _queue, INITIALIZED
+    _transport = queue
+    _worker = worker
+    # fork 得到的异步队列没有对应的写出线程，不再使用
+    _queue = None
+    # 不在 worker 中打开日志文件
+    INITIALIZED = True
+
+
+def listen():
+    """
+    在主进程中调用：返回供 worker 调用 forward 的队列，并启动（唯一的）接收线程
+    """
+    global _inbox, _listener
+    with _listener_lock:
+        if _inbox is None:
+            # SimpleQueue 的 put 直接写入管道，worker 退出时不会丢失尚未发送的记录
+            from multiprocess import SimpleQueue
+            _inbox = SimpleQueue()
+            _listener = threading.Thread(target=_listen_loop, args=(_inbox,), name='logger-listener', daemon=True)
+            _listener.start()
+            atexit.register(_stop_listening)
+        return _inbox
+
+
+def _listen_loop(inbox):
+    """
+    接收线程：异步模式下转入异步队列，否则直接写出
+    出错时只报告错误并继续接收：线程退出后 worker 会在管道写满时一直阻塞
+    """
+    # 上一次报告的错误，同样的错误（如日志文件无法打开）不重复报告
+    failure = None
+    while True:
+        try:
+            record = inbox.get()
+        except (EOFError, OSError):
+            # 管道已经关闭
+            return
+        except Exception as e:
+            # 进程池被终止时可能读到不完整的记录
+            _print('日志接收失败：%s: %s' % (type(e).__name__, e), file=sys.stderr)
+            continue
+        if record is None:
+            return
+        try:
+            queue = _queue
+            if isinstance(record[0], str):
+                # tracing 经同一个队列发送的 span 与同步标记
+                tracing._receive(record)
+            elif queue is not None:
+                _enqueue(queue, record)
+            else:
+                with _write_lock:
+                    # 收到第一条记录时才打开日志文件
+                    _maybe_initialize()
+                    _write_record(record)
+        except Exception as e:
+            reason = '%s: %s' % (type(e).__name__, e)
+            if reason != failure:
+                failure = reason
+                with _write_lock:
+                    _write_failed(record, e)
+
+
+def _stop_listening():
+    """
+    退出时写出管道中剩余的记录
+    """
+    if _listener is not None:
+        _inbox.put(None)
+        _listener.join(1)
+
+
+# 支持 debug(fmt, *args) 形式的延迟格式化；级别被关闭时不做任何格式化
+def debug(msg, *args): return _log(msg, 0, args) if _min_level <= 0 else None
+def info(msg, *args): return _log(msg, 1, args) if _min_level <= 1 else None
+def warning(msg, *args): return _log(msg, 2, args)
+def error(msg, *args): return _log(msg, 3, args)
+def critical(msg, *args): return _log(msg, 4, args)
+
+
+def _parse_time(value):
+    """
+    时间戳，或形如 2020-01-01 12:00:00.000 的本地时间字符串
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value, _, fraction = value.strip().partition('.')
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(value, fmt)) + float('0.' + (fraction or '0'))
+        except ValueError:
+            pass
+    raise ValueError('无法识别的时间：%r' % value)
+
+
+def _parse_level(value):
+    """
+    级别编号，或级别名称（不区分大小写）
+    """
+    if value is None or isinstance(value, int):
+        return value
+    names = [name.strip() for name in LEVELS]
+    if value.upper() not in names:
+        raise ValueError('无法识别的级别：%r' % value)
+    return names.index(value.upper())
+
+
+def query(path=None, start=None, end=None, level=None, worker=None):
+    """
+    查询结构化日志，按文件顺序返回 start <= 时间 < end、级别不低于 level 的记录（dict）
+
+    借助 文件名.idx 只读取时间范围与级别可能匹配的块，其余部分不会被读取；
+    索引之后新写入的部分（至多约 index_every 字节）逐行检查
+
+    Arguments:
+        path: str = None
+            结构化日志路径，默认为当前配置的文件
+
+        start, end: Union[float, str] = None
+            时间戳，或形如 2020-01-01 12:00:00 的本地时间
+
+        level: Union[int, str] = None
+            最低级别，如 2 或 'WARNING'
+
+        worker: int = None
+            只返回指定 worker 的记录
+    """
+    import mmap
+    if path is None:
+        path = os.path.join(CWD, CONFIG['structured']['filename'])
+        if CONFIG['structured']['file'] is not None:
+            CONFIG['structured']['file'].flush()
+    start, end, level = _parse_time(start), _parse_time(end), _parse_level(level)
+    mask = -1 if level is None else -1 << level
+    blocks = []
+    indexed = 0
+    if os.path.exists(path + '.idx'):
+        with open(path + '.idx', 'rb') as index:
+            data = index.read()
+        for offset, length, first, last, levels in _INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % _INDEX_ENTRY.size]):
+            indexed = offset + length
+            if not levels & mask or start is not None and last < start or end is not None and first >= end:
+                continue
+            if blocks and blocks[-1][1] == offset:
+                # 合并相邻的块
+                blocks[-1][1] = indexed
+            else:
+                blocks.append([offset, indexed])
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            return
+        if indexed < size:
+            blocks.append([indexed, size])
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for begin, stop in blocks:
+                for line in data[begin:min(stop, size)].splitlines():
+                    # 每行以 {"time": 时间, "level": 级别 开头，先据此筛选，只解析匹配的行
+                    comma = line.find(b',', 9)
+                    try:
+                        timestamp = float(line[9:comma])
+                        if level is not None and line[comma + 11] - 48 < level \
+                                or start is not None and timestamp < start \
+                                or end is not None and timestamp >= end:
+                            continue
+                        record = json.loads(line)
+                    except (ValueError, IndexError):
+                        # 写入中途的最后一行
+                        continue
+                    if worker is None or record.get('worker') == worker:
+                        yield record
+
+
+def format_record(record):
+    """
+    将结构化记录格式化为与文本日志相同的形式
+    """
+    if 'worker' in record:
+        return '[%s] %s: [worker %s] %s' % (time_string(record['time']), LEVELS[record['level']], record['worker'], record['msg'])
+    return '[%s] %s: %s' % (time_string(record['time']), LEVELS[record['level']], record['msg'])
+
+
+def _main():
+    """
+    命令行查询：python logger.py log.jsonl --start "2020-01-01 12:00" --end "2020-01-01 12:10" --level WARNING
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description='查询结构化日志')
+    parser.add_argument('path')
+    parser.add_argument('--start', help='起始时间（含），时间戳或 2020-01-01 12:00:00')
+    parser.add_argument('--end', help='结束时间（不含）')
+    parser.add_argument('--level', help='最低级别，如 WARNING')
+    parser.add_argument('--worker', type=int, help='只显示指定 worker 的记录')
+    parser.add_argument('--json', action='store_true', help='输出 JSON 而不是文本')
+    arguments = parser.parse_args()
+    start, end = arguments.start, arguments.end
+    start = float(start) if start and start.replace('.', '', 1).isdigit() else start
+    end = float(end) if end and end.replace('.', '', 1).isdigit() else end
+    for record in query(arguments.path, start, end, arguments.level, arguments.worker):
+        _print(json.dumps(record, ensure_ascii=False) if arguments.json else format_record(record))
 
 
-def debug(msg): return _log(msg, 0)
-def info(msg): return _log(msg, 1)
-def warning(msg): return _log(msg, 2)
-def error(msg): return _log(msg, 3)
-def critical(msg): return _log(msg, 4)
+if __name__ == '__main__':
+    _main()
@@ -1,7 +1,11 @@
 """带有友好接口和规整输出的多线程处理库"""
 
-__all__ = ['map', 'reduce', 'map_reduce']
+__all__ = ['map', 'reduce', 'map_reduce', 'Scheduler', 'shared', 'sort', 'isort', 'top_k']
 
 from .reduce import reduce
 from .map_reduce import map_reduce
-from .map import map, imap, imap_unordered, starmap
\ No newline at end of file
+from .map import map, imap, imap_unordered, starmap
+
+from .pool import create_pool
+from .scheduler import Scheduler, shared
+from .sort import isort, sort, top_k
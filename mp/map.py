@@ -4,10 +4,12 @@ import math
 import inspect
 import time
 from ctypes import c_int
-from typing import Any, Callable, Iterable, List, Optional, Tuple, TypeVar
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
 
-from multiprocess import Pool, Value, cpu_count
-from pb import ProgressBar, pb
+import tracing
+from pb import MultiProgress, ProgressBar, pb
+
+from .pool import cpu_count, create_pool, release
 
 # 数据类型
 DT = TypeVar('DT')
@@ -25,8 +27,14 @@ class _WrappedFunction:
         self.callback = callback
         self.counter = 0
 
-    def __call__(self, data: DT) -> RT:
-        result = self.function(data)
+    def __call__(self, *data: DT) -> RT:
+        # starmap 会将参数展开传入
+        if tracing.ENABLED:
+            started = tracing.start()
+            result = self.function(*data)
+            tracing.stop(started, 'mp.compute', 'worker')
+        else:
+            result = self.function(*data)
         self.counter += 1
         if self.counter == self.interval:
             self.callback()
@@ -34,7 +42,27 @@ class _WrappedFunction:
         return result
 
 
+class _TracedFunction:
+    """开启追踪时封装 worker 中执行的函数，每次调用记录一个 span"""
+
+    def __init__(self, function: Callable[..., RT], name: str = 'mp.compute') -> None:
+        self.function = function
+        self.name = name
+
+    def __call__(self, *data: Any) -> RT:
+        started = tracing.start()
+        try:
+            return self.function(*data)
+        finally:
+            tracing.stop(started, self.name, 'worker')
+
+
+def _traced(function: Callable[..., RT]) -> Callable[..., RT]:
+    return _TracedFunction(function) if tracing.ENABLED else function
+
+
 def _adapt(iterable: Iterable[DT], size: int, chunk_size: int, jobs: int) -> Tuple[Iterable[DT], int, int, int]:
+    jobs = jobs or cpu_count()
     # 获取数据长度。仅当数据没有长度，且指定了 chunk_size 时忽略长度
     if not size:
         if hasattr(iterable, '__len__'):
@@ -71,13 +99,23 @@ def _execute(
     jobs: int,
     label: str,
     customize_callback: Callable[[int, Optional[int]], None],
+    affinity: Union[bool, Sequence[int]] = False,
+    threads: int = None,
+    per_worker: bool = False,
 ) -> Iterable[RT]:
+    from multiprocess import Array, Value
+
     iterable, chunk_size, jobs, size = _adapt(iterable, size, chunk_size, jobs)
 
-    # 进度条
-    progress = ProgressBar(label)
+    # 进度条，per_worker 时额外为每个 worker 显示一个进度条
+    bars = MultiProgress() if per_worker else None
+    progress = bars[label] if per_worker else ProgressBar(label, fps=ProgressBar.DEFAULT_FPS)
     # 已完成的数量
     completed = Value(c_int, 0)
+    # 每个 worker 已完成的数量，每个 worker 只写自己的位置，无需加锁
+    worker_completed = Array(c_int, jobs, lock=False)
+    # 用于给 worker 分配位置
+    next_slot = Value(c_int, 0)
     # 更新进度条的区间
     update_interval = max(1, chunk_size // 32)
 
@@ -89,29 +127,48 @@ def _execute(
 
         with _completed.get_lock():
             _completed.value += update_interval
+        globals['_worker_completed'][globals['_worker_slot']] += update_interval
 
     # 传入共享对象
-    def initialize(completed: Value) -> None:
+    def initialize(completed: Value, worker_completed: Array, next_slot: Value) -> None:
         # hack：把变量挂在进程运行栈最底层
         globals = inspect.stack()[-1].frame.f_globals
         globals['_completed'] = completed
-
-    pool = Pool(jobs, initializer=initialize, initargs=(completed,))
-    func = _WrappedFunction(function, update_interval, label, callback)
-    method = getattr(pool, method + '_async')
-    result = method(func, iterable)
-
-    update = customize_callback or progress.update
-    while not result.ready():
-        if size:
-            update(min(completed.value, size - 1), size)
+        globals['_worker_completed'] = worker_completed
+        with next_slot.get_lock():
+            globals['_worker_slot'] = next_slot.value % len(worker_completed)
+            next_slot.value += 1
+
+    with tracing.span('mp.dispatch', 'mp'):
+        pool = create_pool(jobs, initialize, (completed, worker_completed, next_slot), affinity, threads)
+        func = _WrappedFunction(function, update_interval, label, callback)
+        method = getattr(pool, method + '_async')
+        result = method(func, iterable)
+    try:
+        with tracing.span('mp.collect', 'mp'):
+            update = customize_callback or progress.set_count
+            while not result.ready():
+                if size:
+                    update(min(completed.value, size - 1), size)
+                else:
+                    update(completed.value)
+                if per_worker:
+                    for slot in range(jobs):
+                        bars['%s worker %d' % (label, slot)].set_count(worker_completed[slot])
+                # 进度条由后台线程按帧率绘制，无需忙等
+                result.wait(1 / ProgressBar.DEFAULT_FPS)
+
+            if size:
+                progress.set_count(size, size)
+
+            return result.get()
+    finally:
+        # 总数未知、出错或被中断时没有最终状态，停止后台绘制线程
+        if per_worker:
+            bars.close()
         else:
-            update(completed.value)
-
-    if size:
-        progress.update(size, size)
-
-    return result.get()
+            progress._flush()
+        release(pool)
 
 
 def map(
@@ -119,14 +176,21 @@ def map(
     iterable: Iterable[DT],
     size: int = None,
     chunk_size: int = None,
-    jobs: int = cpu_count(),
+    jobs: int = None,
     silent: bool = False,
     label: str = 'Map',
     customize_callback: Callable[[int, Optional[int]], None] = None,
+    affinity: Union[bool, Sequence[int]] = False,
+    threads: int = None,
+    per_worker: bool = False,
 ) -> List[RT]:
     if silent:
-        return Pool(jobs).map(function, iterable, chunk_size)
-    return _execute('map', function, iterable, size, chunk_size, jobs, label, customize_callback)
+        pool = create_pool(jobs, affinity=affinity, threads=threads)
+        try:
+            return pool.map(_traced(function), iterable, chunk_size)
+        finally:
+            release(pool)
+    return _execute('map', function, iterable, size, chunk_size, jobs, label, customize_callback, affinity, threads, per_worker)
 
 
 def imap(
@@ -134,12 +198,15 @@ def imap(
     iterable: Iterable[DT],
     size: int = None,
     chunk_size: int = None,
-    jobs: int = cpu_count(),
+    jobs: int = None,
     silent: bool = False,
     label: str = 'IMap',
+    affinity: Union[bool, Sequence[int]] = False,
+    threads: int = None,
 ) -> Iterable[RT]:
     iterable, chunk_size, jobs, size = _adapt(iterable, size, chunk_size, jobs)
-    result = Pool(jobs).imap(function, iterable, chunk_size)
+    pool = create_pool(jobs, affinity=affinity, threads=threads)
+    result = pool.imap(_traced(function), iterable, chunk_size)
     if silent:
         return result
     return pb(result, size=size, label=label)
@@ -150,12 +217,15 @@ def imap_unordered(
     iterable: Iterable[DT],
     size: int = None,
     chunk_size: int = None,
-    jobs: int = cpu_count(),
+    jobs: int = None,
     silent: bool = False,
     label: str = 'IMap Unordered',
+    affinity: Union[bool, Sequence[int]] = False,
+    threads: int = None,
 ) -> Iterable[RT]:
     iterable, chunk_size, jobs, size = _adapt(iterable, size, chunk_size, jobs)
-    result = Pool(jobs).imap_unordered(function, iterable, chunk_size)
+    pool = create_pool(jobs, affinity=affinity, threads=threads)
+    result = pool.imap_unordered(_traced(function), iterable, chunk_size)
     if silent:
         return result
     return pb(result, size=size, label=label)
@@ -166,10 +236,17 @@ def starmap(
     iterable: Iterable[Iterable[Any]],
     size: int = None,
     chunk_size: int = None,
-    jobs: int = cpu_count(),
+    jobs: int = None,
     silent: bool = False,
     label: str = 'StarMap',
+    affinity: Union[bool, Sequence[int]] = False,
+    threads: int = None,
+    per_worker: bool = False,
 ) -> List[RT]:
     if silent:
-        return Pool(jobs).starmap(function, iterable, chunk_size)
-    return _execute('starmap', function, iterable, size, chunk_size, jobs, label)
+        pool = create_pool(jobs, affinity=affinity, threads=threads)
+        try:
+            return pool.starmap(_traced(function), iterable, chunk_size)
+        finally:
+            release(pool)
+    return _execute('starmap', function, iterable, size, chunk_size, jobs, label, None, affinity, threads, per_worker)
@@ -1,13 +1,12 @@
 """Map-Reduce"""
 
 from math import ceil
-from multiprocessing import cpu_count
 from typing import Any, Callable, Generator, Iterable
 
-from more_itertools import chunked, first, take
 from pb import ProgressBar
 
 from .map import map
+from .pool import cpu_count
 
 
 def map_reduce(
@@ -17,7 +16,7 @@ def map_reduce(
     size: int = -1,
     chunk_size: int = 16,
     batch_size: int = 8192,
-    jobs: int = cpu_count(),
+    jobs: int = None,
     silent: bool = False,
     label: str = 'map-reduce',
 ) -> Generator[list, None, None]:
@@ -44,7 +43,7 @@ def map_reduce(
         batch_size: int = 8192
             每次迭代之多使用的元素数量，不会小于 chunk_size * jobs
 
-        jobs: int = cpu_count()
+        jobs: int = None
             开启线程数量，默认为核心数量
 
         silent: bool = False
@@ -53,8 +52,11 @@ def map_reduce(
         label: str = 'reduce'
             进度条显示名称
     """
+    from more_itertools import chunked, first, take
+
+    jobs = jobs or cpu_count()
     completed = 0
-    progress_bar = ProgressBar(label)
+    progress_bar = ProgressBar(label, fps=ProgressBar.DEFAULT_FPS)
     progress_bar.reset()
 
     def _map_reduce_chunk(chunk: Iterable) -> Any:
@@ -109,7 +111,7 @@ def map_reduce(
             jobs=jobs,
             silent=silent,
             customize_callback=lambda current, _=None:
-            progress_bar.update(
+            progress_bar.set_count(
                 min(
                     to_complete,
                     current * (optimized_chunk_size - 1)
@@ -135,7 +137,7 @@ def map_reduce(
                 reduce_layer(i)
                 i += 1
             result = _reduce_chunk(output[i])
-            progress_bar.update(completed + len(output[i]), size)
+            progress_bar.set_count(completed + len(output[i]), size)
             return result
         if len(output[i]) > batch_size:
             reduce_layer(i)
@@ -0,0 +1,158 @@
+"""进程池的创建与 worker 初始化"""
+
+import os
+from functools import lru_cache
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Union
+
+import tracing
+
+# 限制原生库线程数的环境变量
+THREAD_ENV_VARS = [
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'BLIS_NUM_THREADS',
+]
+
+
+@lru_cache(maxsize=None)
+def cpu_count() -> int:
+    """CPU 数量，在首次调用时计算，用作 jobs 的默认值"""
+    return os.cpu_count() or 1
+
+
+def _available_cpus() -> List[int]:
+    """当前进程允许使用的 CPU 编号"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(cpu_count()))
+
+
+def _default_threads(jobs: int) -> Optional[int]:
+    """jobs > 1 时，每个 worker 平分核心，避免 jobs × 核心数 个线程互相争抢"""
+    if jobs <= 1:
+        return None
+    return max(1, len(_available_cpus()) // jobs)
+
+
+def _limit_threads(threads: int) -> None:
+    """限制当前进程中 NumPy/BLAS/OpenMP 等原生库的线程数"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    # 若父进程已经加载了相关库，环境变量不再生效，需要通过 threadpoolctl 修改
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(threads)
+
+
+def _pin_cpu(cpus: Sequence[int]) -> None:
+    """按 worker 编号将当前进程绑定到一个 CPU 上"""
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return
+    index = max(0, _worker_index() - 1)
+    os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+
+
+def _worker_index() -> int:
+    """Pool 中 worker 的编号，从 1 开始"""
+    from multiprocess import current_process
+    identity = current_process()._identity
+    return identity[-1] if identity else 0
+
+
+def _initialize_worker(
+    cpus: Optional[Sequence[int]],
+    threads: Optional[int],
+    log_queue: Any,
+    trace_queue: Any,
+    initializer: Optional[Callable[..., None]],
+    initargs: Iterable[Any],
+) -> None:
+    """worker 启动时先设置亲和性、线程数、日志与 span 的转发，再执行用户的 initializer"""
+    if cpus:
+        _pin_cpu(cpus)
+    if threads:
+        _limit_threads(threads)
+    if log_queue is not None:
+        import logger
+        logger.forward(log_queue, _worker_index())
+    if trace_queue is not None:
+        tracing.forward(trace_queue, _worker_index())
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def create_pool(
+    jobs: int,
+    initializer: Callable[..., None] = None,
+    initargs: Iterable[Any] = (),
+    affinity: Union[bool, Sequence[int]] = False,
+    threads: int = None,
+    forward_logs: bool = True,
+) -> 'Pool':
+    """
+    创建进程池
+
+    Arguments:
+        jobs: int
+            进程数量，为 None 时使用 CPU 数量
+
+        initializer: Callable[..., None] = None
+            每个 worker 启动时执行的函数
+
+        initargs: Iterable[Any] = ()
+            initializer 的参数
+
+        affinity: Union[bool, Sequence[int]] = False
+            是否将每个 worker 绑定到单个 CPU（仅 Linux 有效）
+            为 True 时依次使用当前进程可用的 CPU，也可以直接指定 CPU 编号列表
+
+        threads: int = None
+            每个 worker 中原生库（BLAS、OpenMP 等）的线程上限
+            为 None 时，若 jobs > 1 则取 可用核心数 // jobs；为 0 则不作限制
+
+        forward_logs: bool = True
+            worker 中 logger 的日志通过队列交给主进程统一写出，并标注 worker 编号
+
+    开启 tracing 时创建的进程池，worker 中的 span 也经同一个队列汇总到主进程
+    """
+    # multiprocess 会加载 dill，仅在真正创建进程池时导入
+    from multiprocess import Pool
+
+    jobs = jobs or cpu_count()
+    if affinity is True:
+        cpus = _available_cpus()
+    elif affinity:
+        cpus = list(affinity)
+    else:
+        cpus = None
+    if threads is None:
+        threads = _default_threads(jobs)
+    # 日志与 span 共用主进程中的同一个接收队列
+    queue = None
+    if forward_logs or tracing.ENABLED:
+        import logger
+        queue = logger.listen()
+    return Pool(
+        jobs,
+        initializer=_initialize_worker,
+        initargs=(
+            cpus, threads, queue if forward_logs else None, queue if tracing.ENABLED else None,
+            initializer, tuple(initargs),
+        ),
+    )
+
+
+def release(pool: 'Pool') -> None:
+    """
+    结束进程池。开启追踪时等待 worker 正常退出，使其发送尚未发送的 span
+    """
+    if tracing.ENABLED:
+        pool.close()
+        pool.join()
+    else:
+        pool.terminate()
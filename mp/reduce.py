@@ -5,11 +5,11 @@
 from functools import partial
 from typing import Any, Callable, Generator, Iterable, Iterator
 
-from more_itertools import chunked, first, take
-from multiprocess import Process, Queue, cpu_count
+import tracing
 from pb import ProgressBar
 
 from .map import map
+from .pool import cpu_count
 
 
 def reduce(
@@ -18,7 +18,7 @@ def reduce(
     size: int = -1,
     chunk_size: int = 16,
     batch_size: int = 8192,
-    jobs: int = cpu_count(),
+    jobs: int = None,
     silent: bool = False,
     label: str = 'reduce',
 ) -> Generator[list, None, None]:
@@ -41,7 +41,7 @@ def reduce(
         batch_size: int = 8192
             每次迭代之多使用的元素数量，不会小于 chunk_size * jobs
 
-        jobs: int = cpu_count()
+        jobs: int = None
             开启线程数量，默认为核心数量
 
         silent: bool = False
@@ -50,9 +50,12 @@ def reduce(
         label: str = 'reduce'
             进度条显示名称
     """
+    from more_itertools import chunked, first, take
+
+    jobs = jobs or cpu_count()
     batch_size = max(batch_size, chunk_size * jobs)
     completed = 0
-    progress_bar = ProgressBar(label)
+    progress_bar = ProgressBar(label, fps=ProgressBar.DEFAULT_FPS)
     progress_bar.reset()
 
     def _reduce_chunk(chunk: Iterable) -> Any:
@@ -75,6 +78,7 @@ def reduce(
     # 分层计算，每一层达到上限后计算下一层
     output = [take(batch_size, iterator)]
 
+    @tracing.traced('mp.reduce.layer', 'mp')
     def reduce_layer(index: int):
         nonlocal completed
         if index + 1 >= len(output):
@@ -85,7 +89,7 @@ def reduce(
             chunk_size=1,
             jobs=jobs,
             silent=silent,
-            customize_callback=lambda current, _=None: progress_bar.update(
+            customize_callback=lambda current, _=None: progress_bar.set_count(
                 current * 15 + completed, size),
         )
         completed += len(output[index]) - len(result)
@@ -110,14 +114,14 @@ def reduce(
                     chunk_size=1,
                     jobs=jobs,
                     silent=silent,
-                    customize_callback=lambda current, _=None: progress_bar.update(
+                    customize_callback=lambda current, _=None: progress_bar.set_count(
                         current * (new_chunk_size - 1) + completed, size),
                 )
                 completed += len(chunk) - len(new_chunk)
                 chunk = new_chunk
             result = _reduce_chunk(chunk)
             completed += len(chunk)
-            progress_bar.update(completed, size)
+            progress_bar.set_count(completed, size)
             return result
         if len(output[i]) > batch_size:
             reduce_layer(i)
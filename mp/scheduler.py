@@ -0,0 +1,337 @@
+"""多个并发调用共享同一个进程池，按优先级与权重调度"""
+
+import threading
+from collections import deque
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Generator, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import tracing
+from pb import ProgressBar
+
+from .pool import cpu_count, create_pool, release
+
+
+def _run_chunk(function: Callable, chunk: List[Any], star: bool) -> List[Any]:
+    """在 worker 中处理一个 chunk"""
+    with tracing.span('mp.compute', 'worker'):
+        if star:
+            result = [function(*item) for item in chunk]
+        else:
+            result = [function(item) for item in chunk]
+    if tracing.ENABLED:
+        # 调度器的进程池可能一直不关闭（如 mp.shared()），span 不能等到 worker 退出时才发送
+        tracing._flush()
+    return result
+
+
+def _chunks(iterable: Iterable, chunk_size: int) -> Iterator[Tuple[int, List[Any]]]:
+    """按 chunk_size 切分数据，同时给出 chunk 序号"""
+    iterator = iter(iterable)
+    index = 0
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield index, chunk
+        index += 1
+
+
+# _collect 中表示需要先读取输入
+_FEED = object()
+
+
+class _Call:
+    """一次 map / imap 调用在调度器中的状态"""
+
+    def __init__(self, function: Callable, iterable: Iterable, chunk_size: int, priority: int, weight: float, star: bool) -> None:
+        if weight <= 0:
+            raise ValueError('weight must be positive, got %r' % weight)
+        self.function = function
+        # 只在调用者线程中、不持有调度器的锁时读取，
+        # 读取缓慢的输入不会阻塞其他调用，输入也可以是同一个调度器的 imap 结果
+        self.chunks = _chunks(iterable, chunk_size)
+        # 已经读取、尚未提交的 chunk
+        self.buffer = deque()
+        # 输入已经全部读取
+        self.read_all = False
+        self.priority = priority
+        self.weight = weight
+        self.star = star
+        # 虚拟时间：每提交一个数据增加 1 / weight，同优先级中虚拟时间最小者先提交
+        self.pass_ = 0.0
+        # 不再提交新的 chunk：数据已经全部提交、出错或调用已经结束
+        self.exhausted = False
+        # 已提交但尚未完成的 chunk 数量
+        self.pending = 0
+        # 已完成的 chunk：序号 -> 结果
+        self.results = {}
+        self.error = None
+
+    @property
+    def finished(self) -> bool:
+        return self.exhausted and self.pending == 0
+
+
+class Scheduler:
+    """
+    共享进程池调度器
+
+    多个线程同时调用 map / imap 时，所有数据都提交到同一个进程池，worker 总数保持为 jobs。
+    每次有空闲时，优先提交 priority 最高的调用的 chunk；priority 相同的调用按 weight 比例公平分享。
+    同时在途的 chunk 数量不超过 jobs * queue_depth，因此新来的高优先级调用最多只需等待这些 chunk 完成。
+    每个调用的输入由调用者线程预先读取至多 jobs * queue_depth 个 chunk，调度时只提交已经读取的 chunk。
+    """
+
+    def __init__(
+        self,
+        jobs: int = None,
+        queue_depth: int = 2,
+        affinity: Union[bool, Sequence[int]] = False,
+        threads: int = None,
+    ) -> None:
+        self.jobs = jobs or cpu_count()
+        self.capacity = max(1, self.jobs * queue_depth)
+        self._pool_options = {'affinity': affinity, 'threads': threads}
+        self._pool = None
+        self._condition = threading.Condition()
+        self._calls = []
+        self._in_flight = 0
+        # 最近一次被提交的调用的虚拟时间，新加入的调用从这里开始计时
+        self._virtual_time = 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = create_pool(self.jobs, **self._pool_options)
+        return self._pool
+
+    def _select(self) -> Optional[_Call]:
+        """选出下一个提交 chunk 的调用"""
+        best = None
+        for call in self._calls:
+            if call.exhausted or not call.buffer:
+                continue
+            if best is None or (-call.priority, call.pass_) < (-best.priority, best.pass_):
+                best = call
+        return best
+
+    @tracing.traced('mp.dispatch', 'mp')
+    def _dispatch(self) -> None:
+        """在持有锁时调用，尽量填满在途 chunk 数量"""
+        while self._in_flight < self.capacity:
+            call = self._select()
+            if call is None:
+                return
+            index, chunk = call.buffer.popleft()
+            if call.read_all and not call.buffer:
+                call.exhausted = True
+            self._virtual_time = call.pass_
+            call.pass_ += len(chunk) / call.weight
+            call.pending += 1
+            self._in_flight += 1
+            self._get_pool().apply_async(
+                _run_chunk,
+                (call.function, chunk, call.star),
+                callback=partial(self._complete, call, index),
+                error_callback=partial(self._fail, call),
+            )
+
+    def _complete(self, call: _Call, index: int, result: List[Any]) -> None:
+        with self._condition:
+            call.results[index] = result
+            call.pending -= 1
+            self._in_flight -= 1
+            self._dispatch()
+            self._condition.notify_all()
+
+    def _fail(self, call: _Call, error: BaseException) -> None:
+        with self._condition:
+            call.error = error
+            call.exhausted = True
+            call.pending -= 1
+            self._in_flight -= 1
+            self._dispatch()
+            self._condition.notify_all()
+
+    def _submit(self, call: _Call) -> None:
+        with self._condition:
+            call.pass_ = self._virtual_time
+            self._calls.append(call)
+
+    def _feed(self, call: _Call) -> None:
+        """在调用者线程中（不持有锁）读取一个 chunk 放入缓冲区并提交；输入抛出的异常直接传给调用者"""
+        try:
+            item = next(call.chunks)
+        except StopIteration:
+            item = None
+        with self._condition:
+            if item is None:
+                call.read_all = True
+                if not call.buffer:
+                    call.exhausted = True
+                    self._condition.notify_all()
+            else:
+                call.buffer.append(item)
+            self._dispatch()
+
+    def _collect(self, call: _Call, ordered: bool, size: Optional[int], progress: Optional[ProgressBar]) -> Generator[Any, None, None]:
+        """
+        在调用者线程中等待并按顺序（或完成顺序）取出结果
+        调用在第一次取结果时才提交：从未迭代的结果不会占用 worker，也不会一直留在调度队列中
+        """
+        self._submit(call)
+        completed = 0
+        next_index = 0
+        try:
+            while True:
+                with self._condition:
+                    while True:
+                        if call.error is not None:
+                            raise call.error
+                        if not call.read_all and len(call.buffer) < self.capacity:
+                            # 先补充输入，使 worker 空闲时总有该调用的 chunk 可以提交
+                            chunk = _FEED
+                            break
+                        if ordered and next_index in call.results:
+                            chunk = call.results.pop(next_index)
+                            next_index += 1
+                            break
+                        if not ordered and call.results:
+                            chunk = call.results.pop(next(iter(call.results)))
+                            break
+                        if call.finished:
+                            chunk = None
+                            break
+                        self._condition.wait()
+                if chunk is None:
+                    break
+                if chunk is _FEED:
+                    self._feed(call)
+                    continue
+                yield from chunk
+                completed += len(chunk)
+                if progress is not None:
+                    if size:
+                        progress._update_total(min(completed, size - 1), size)
+                    else:
+                        progress._update_count(completed)
+            if progress is not None and size:
+                progress._update_total(size, size)
+        finally:
+            if progress is not None:
+                # 总数未知或提前结束时没有最终状态，停止后台绘制线程
+                progress._flush()
+            with self._condition:
+                call.exhausted = True
+                call.buffer.clear()
+                self._calls.remove(call)
+
+    def _start(
+        self,
+        function: Callable,
+        iterable: Iterable,
+        size: int,
+        chunk_size: int,
+        priority: int,
+        weight: float,
+        ordered: bool,
+        star: bool,
+        silent: bool,
+        label: str,
+    ) -> Generator[Any, None, None]:
+        if size is None and hasattr(iterable, '__len__'):
+            size = len(iterable)
+        call = _Call(function, iterable, chunk_size, priority, weight, star)
+        progress = None if silent else ProgressBar(label, fps=ProgressBar.DEFAULT_FPS)
+        return self._collect(call, ordered, size, progress)
+
+    def imap(
+        self,
+        function: Callable,
+        iterable: Iterable,
+        size: int = None,
+        chunk_size: int = 1,
+        priority: int = 0,
+        weight: float = 1,
+        silent: bool = False,
+        label: str = 'Shared IMap',
+    ) -> Iterable[Any]:
+        """
+        返回按输入顺序排列的结果迭代器，第一次取结果时提交调用
+
+        Arguments:
+            priority: int = 0
+                优先级，高优先级调用的数据总是先于低优先级调用提交
+
+            weight: float = 1
+                同优先级调用之间按 weight 比例分享 worker
+        """
+        return self._start(function, iterable, size, chunk_size, priority, weight, True, False, silent, label)
+
+    def imap_unordered(
+        self,
+        function: Callable,
+        iterable: Iterable,
+        size: int = None,
+        chunk_size: int = 1,
+        priority: int = 0,
+        weight: float = 1,
+        silent: bool = False,
+        label: str = 'Shared IMap Unordered',
+    ) -> Iterable[Any]:
+        """同 imap，但按完成顺序返回结果"""
+        return self._start(function, iterable, size, chunk_size, priority, weight, False, False, silent, label)
+
+    def map(
+        self,
+        function: Callable,
+        iterable: Iterable,
+        size: int = None,
+        chunk_size: int = 1,
+        priority: int = 0,
+        weight: float = 1,
+        silent: bool = False,
+        label: str = 'Shared Map',
+    ) -> List[Any]:
+        """同 imap，返回结果列表"""
+        return list(self._start(function, iterable, size, chunk_size, priority, weight, True, False, silent, label))
+
+    def starmap(
+        self,
+        function: Callable,
+        iterable: Iterable[Iterable[Any]],
+        size: int = None,
+        chunk_size: int = 1,
+        priority: int = 0,
+        weight: float = 1,
+        silent: bool = False,
+        label: str = 'Shared StarMap',
+    ) -> List[Any]:
+        """同 map，但将每个数据展开作为参数"""
+        return list(self._start(function, iterable, size, chunk_size, priority, weight, True, True, silent, label))
+
+    def close(self) -> None:
+        """终止进程池"""
+        with self._condition:
+            if self._pool is not None:
+                release(self._pool)
+                self._pool = None
+
+    def __enter__(self) -> 'Scheduler':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared() -> Scheduler:
+    """进程内共用的调度器，在首次调用时创建"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Scheduler()
+        return _shared
@@ -0,0 +1,208 @@
+"""并行排序、外部排序与 top-k"""
+
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from collections import deque
+from itertools import chain, islice
+from typing import Any, Callable, Generator, Iterable, Iterator, List, Optional
+
+import tracing
+from pb import ProgressBar
+
+from .map import _traced
+from .pool import cpu_count, create_pool, release
+
+# 外部排序写盘时，每次 pickle 的元素数量
+_SPILL_BLOCK = 4096
+
+
+def _sort_run(run: List[Any], key: Optional[Callable], reverse: bool) -> List[Any]:
+    """在 worker 中对一段数据排序"""
+    run.sort(key=key, reverse=reverse)
+    return run
+
+
+def _spill_run(run: List[Any], key: Optional[Callable], reverse: bool, directory: str) -> str:
+    """在 worker 中对一段数据排序并写入临时文件，返回文件路径"""
+    run.sort(key=key, reverse=reverse)
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as file:
+        for i in range(0, len(run), _SPILL_BLOCK):
+            pickle.dump(run[i:i + _SPILL_BLOCK], file, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path: str) -> Generator[Any, None, None]:
+    """流式读取一个已排序的临时文件"""
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                block = pickle.load(file)
+            except EOFError:
+                return
+            yield from block
+
+
+def _top_k_run(run: List[Any], k: int, key: Optional[Callable], largest: bool) -> List[Any]:
+    """在 worker 中求一段数据的 top-k"""
+    return (heapq.nlargest if largest else heapq.nsmallest)(k, run, key=key)
+
+
+def _runs(iterable: Iterable, run_size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        run = list(islice(iterator, run_size))
+        if not run:
+            return
+        yield run
+
+
+def _windowed(
+    function: Callable,
+    runs: Iterable[List[Any]],
+    args: tuple,
+    jobs: int,
+    size: Optional[int],
+    silent: bool,
+    label: str,
+) -> Generator[Any, None, None]:
+    """
+    将每段数据提交给进程池，按提交顺序返回结果
+    同时在途的段数不超过 2 * jobs，因此输入可以是无法整体放入内存的迭代器
+    """
+    progress = None if silent else ProgressBar(label, fps=ProgressBar.DEFAULT_FPS)
+    completed = 0
+    pending = deque()
+    pool = create_pool(jobs)
+    function = _traced(function)
+    try:
+        for run in chain(runs, [None]):
+            if run is not None:
+                pending.append((len(run), pool.apply_async(function, (run,) + args)))
+                if len(pending) < 2 * jobs:
+                    continue
+            while pending and (run is None or len(pending) >= 2 * jobs):
+                length, result = pending.popleft()
+                yield result.get()
+                completed += length
+                if progress is not None:
+                    if size:
+                        progress._update_total(min(completed, size - 1), size)
+                    else:
+                        progress._update_count(completed)
+        if progress is not None and size:
+            progress._update_total(size, size)
+    finally:
+        if progress is not None:
+            # 总数未知或提前结束时没有最终状态，停止后台绘制线程
+            progress._flush()
+        release(pool)
+
+
+def sort(
+    iterable: Iterable,
+    key: Callable[[Any], Any] = None,
+    reverse: bool = False,
+    jobs: int = None,
+    run_size: int = None,
+    silent: bool = False,
+    label: str = 'Sort',
+) -> List[Any]:
+    """
+    并行排序，结果同内置 sorted（稳定排序）
+
+    数据被切分为若干段，由 worker 分别排序后在主进程中 k 路归并。
+    结果需要整体放入内存；数据过大时使用 isort
+
+    Arguments:
+        key: Callable[[Any], Any] = None
+            同 sorted 的 key，需要能够被序列化
+
+        run_size: int = None
+            每段数据的数量，默认将数据平均分为 jobs * 4 段
+    """
+    jobs = jobs or cpu_count()
+    data = iterable if isinstance(iterable, list) else list(iterable)
+    if jobs <= 1 or len(data) < 2 * jobs:
+        return sorted(data, key=key, reverse=reverse)
+    run_size = run_size or -(-len(data) // (jobs * 4))
+    runs = list(_windowed(_sort_run, _runs(data, run_size), (key, reverse), jobs, len(data), silent, label))
+    with tracing.span('mp.sort.merge', 'mp'):
+        return list(heapq.merge(*runs, key=key, reverse=reverse))
+
+
+def isort(
+    iterable: Iterable,
+    key: Callable[[Any], Any] = None,
+    reverse: bool = False,
+    jobs: int = None,
+    run_size: int = 1000000,
+    size: int = None,
+    directory: str = None,
+    silent: bool = False,
+    label: str = 'External Sort',
+) -> Generator[Any, None, None]:
+    """
+    外部归并排序，返回按顺序产生结果的迭代器
+
+    每读取 run_size 个数据，交给 worker 排序并写入临时文件；之后流式 k 路归并所有文件。
+    内存中最多同时保留约 2 * jobs 段数据，临时文件在迭代结束或迭代器关闭时删除
+
+    Arguments:
+        run_size: int = 1000000
+            每段数据的数量
+
+        size: int = None
+            数据总量，仅用于显示进度
+
+        directory: str = None
+            存放临时文件的目录，默认使用系统临时目录
+    """
+    jobs = jobs or cpu_count()
+    if size is None and hasattr(iterable, '__len__'):
+        size = len(iterable)
+    directory = tempfile.mkdtemp(prefix='mp-sort-', dir=directory)
+    try:
+        paths = list(_windowed(
+            _spill_run, _runs(iterable, run_size), (key, reverse, directory),
+            jobs, size, silent, label,
+        ))
+        yield from heapq.merge(*[_read_run(path) for path in paths], key=key, reverse=reverse)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def top_k(
+    iterable: Iterable,
+    k: int,
+    key: Callable[[Any], Any] = None,
+    largest: bool = True,
+    jobs: int = None,
+    run_size: int = 65536,
+    size: int = None,
+    silent: bool = False,
+    label: str = 'Top-K',
+) -> List[Any]:
+    """
+    并行求最大（或最小）的 k 个数据，结果同 heapq.nlargest / heapq.nsmallest
+
+    每个 worker 只返回自己那段数据的 top-k，主进程中始终只保留 k 个候选，
+    因此内存占用与数据总量无关
+
+    Arguments:
+        largest: bool = True
+            为 False 时求最小的 k 个
+    """
+    jobs = jobs or cpu_count()
+    if size is None and hasattr(iterable, '__len__'):
+        size = len(iterable)
+    select = heapq.nlargest if largest else heapq.nsmallest
+    best = []
+    if k <= 0:
+        return best
+    for result in _windowed(_top_k_run, _runs(iterable, run_size), (k, key, largest), jobs, size, silent, label):
+        best = select(k, chain(best, result), key=key)
+    return best
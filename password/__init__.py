@@ -5,62 +5,197 @@
 import datetime
 import os
 import pickle
-import random
+import sqlite3
+import time
 from inspect import signature
 from string import *
 from typing import *
 
+from environment_check import interactive
 from styles import bold, green
 
-_HISTORY_PATH = os.path.join(os.path.dirname(__file__), 'history')
+_HISTORY_PATH = os.path.join(os.path.dirname(__file__), 'history.sqlite')
+# 旧版本使用的 pickle 文件，首次打开数据库时导入
+_LEGACY_PATH = os.path.join(os.path.dirname(__file__), 'history')
+# 记录保存的时间
+_RETENTION = datetime.timedelta(days=7).total_seconds()
+# 清除过期记录的最短间隔
+_PURGE_INTERVAL = 3600
 
 
-def _save(method: str, password: str):
+def _connect() -> sqlite3.Connection:
+    """
+    打开历史数据库。SQLite 自身对文件加锁，多个进程可以同时写入，等待锁的时间最长 30 秒
+    """
+    connection = sqlite3.connect(_HISTORY_PATH, timeout=30, isolation_level=None)
+    connection.execute('CREATE TABLE IF NOT EXISTS history (time REAL, method TEXT, password TEXT)')
+    connection.execute('CREATE INDEX IF NOT EXISTS history_time ON history (time)')
+    connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)')
+    if os.path.exists(_LEGACY_PATH):
+        _import_legacy(connection)
+    return connection
+
+
+def _import_legacy(connection: sqlite3.Connection):
+    """
+    导入旧版本的 pickle 记录并删除该文件
     """
-    保存一个记录，同时清除超过 7 天的记录
-    """
-    # 当前时间
-    now = datetime.datetime.now()
-    # 记录
-    new = {
-        'method': method,
-        'password': password,
-        'time': now,
-    }
-    # 加载已保存记录
     try:
-        saved = pickle.load(open(_HISTORY_PATH, 'rb'))
-    except (FileNotFoundError, pickle.UnpicklingError):
+        with open(_LEGACY_PATH, 'rb') as file:
+            saved = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
         saved = []
-    # 过滤超过 7 天的记录
-    saved = [
-        entry for entry in saved
-        if now - entry['time'] < datetime.timedelta(days=7)
-    ]
-    # 添加记录并保存
-    pickle.dump(saved + [new], open(_HISTORY_PATH, 'wb'))
+    with connection:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.executemany('INSERT INTO history VALUES (?, ?, ?)', [
+            (entry['time'].timestamp(), entry['method'], entry['password']) for entry in saved
+        ])
+    try:
+        os.remove(_LEGACY_PATH)
+    except FileNotFoundError:
+        pass
 
 
-def _contain_all(password: str, charsets: Iterable[str]) -> bool:
+def _save(method: str, password: str):
     """
-    判断密码是否包含所有字符集中的字符
+    保存一个记录
     """
-    return all(set(password) & set(charset) for charset in charsets)
+    _save_many([(method, password)])
+
+
+def _save_many(entries: Iterable[Tuple[str, str]]):
+    """
+    在一个事务中追加多个 (方法, 密码) 记录；每隔 _PURGE_INTERVAL 秒顺带清除一次超过 7 天的记录
+    """
+    now = time.time()
+    connection = _connect()
+    try:
+        with connection:
+            # 立即获取写锁，避免多个进程同时写入时死锁
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'INSERT INTO history VALUES (?, ?, ?)',
+                ((now, method, password) for method, password in entries),
+            )
+            purged = connection.execute("SELECT value FROM meta WHERE key = 'purged'").fetchone()
+            if purged is None or now - purged[0] >= _PURGE_INTERVAL:
+                connection.execute('DELETE FROM history WHERE time < ?', (now - _RETENTION,))
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('purged', ?)", (now,))
+    finally:
+        connection.close()
+
+
+class _RandomBytes:
+    """
+    从 os.urandom 批量读取的随机字节流，按需转换为字符或整数
+    """
+
+    # 每次读取的字节数
+    CHUNK = 1 << 16
+
+    def __init__(self):
+        self._buffer = b''
+        self._position = 0
+        # 字符集 -> bytes.translate 的映射表与需要丢弃的字节
+        self._tables = {}
+
+    def _read(self, count: int) -> bytes:
+        if self._position + count > len(self._buffer):
+            self._buffer = self._buffer[self._position:] + os.urandom(max(self.CHUNK, count))
+            self._position = 0
+        data = self._buffer[self._position:self._position + count]
+        self._position += count
+        return data
+
+    def chars(self, alphabet: str, count: int) -> str:
+        """
+        count 个从 alphabet 中均匀选取的字符。超出 alphabet 长度整数倍的字节被丢弃，因此没有取模偏差
+        """
+        if alphabet not in self._tables:
+            limit = 256 - 256 % len(alphabet)
+            table = bytes(ord(alphabet[b % len(alphabet)]) for b in range(limit)) + bytes(256 - limit)
+            self._tables[alphabet] = table, bytes(range(limit, 256))
+        table, rejected = self._tables[alphabet]
+        result = b''
+        while len(result) < count:
+            # 每次多读一些，以补足被丢弃的字节
+            need = count - len(result)
+            result += self._read(need + need // 2 + 8).translate(table, rejected)
+        return result[:count].decode('ascii')
+
+    def below(self, n: int) -> int:
+        """[0, n) 中均匀的整数：读取足够表示 n 的字节数，超出 n 整数倍的值被丢弃"""
+        size = max(1, (n.bit_length() + 7) // 8)
+        space = 1 << (8 * size)
+        limit = space - space % n
+        while True:
+            value = int.from_bytes(self._read(size), 'little')
+            if value < limit:
+                return value % n
+
+
+# 策略：长度、必须包含的字符集、格式化方式
+_POLICIES = {
+    'gen': (14, [digits, ascii_lowercase, ascii_uppercase]),
+    'complex': (32, [digits, ascii_lowercase, ascii_uppercase, punctuation]),
+    'no_symbol': (16, [digits, ascii_lowercase, ascii_uppercase]),
+}
+
+
+def _generate(randomness: _RandomBytes, length: int, charsets: List[str]) -> str:
+    """
+    先从全部字符中均匀生成 length - len(charsets) 个字符，再将每个字符集中的一个字符插入随机位置
+    其余字符独立同分布，因此插入随机位置等同于整体随机排列，不需要整串重新生成
+    """
+    if length < len(charsets):
+        raise ValueError('length %d is too short to contain %d character sets' % (length, len(charsets)))
+    chars = list(randomness.chars(''.join(charsets), length - len(charsets)))
+    for charset in charsets:
+        chars.insert(randomness.below(len(chars) + 1), randomness.chars(charset, 1))
+    return ''.join(chars)
+
+
+def _format(policy: str, password: str) -> str:
+    if policy == 'gen':
+        return '-'.join([password[:5], password[5:-5], password[-5:]])
+    return password
+
+
+def generate_many(n: int, policy: str = 'gen', length: int = None, save: bool = True) -> List[str]:
+    """
+    批量生成 n 个密码，不打印，历史在一个事务中写入
+
+    Arguments:
+        policy: str = 'gen'
+            'gen'、'complex' 或 'no_symbol'，同名函数的规则
+
+        length: int = None
+            密码长度，默认使用策略的长度
+
+        save: bool = True
+            是否保存到历史
+    """
+    if policy not in _POLICIES:
+        raise ValueError('unknown policy %r, expected one of %s' % (policy, ', '.join(_POLICIES)))
+    default_length, charsets = _POLICIES[policy]
+    length = length or default_length
+    if policy == 'gen' and length < 11:
+        # 格式为 5 位-中间部分-5 位，中间部分不能为空
+        raise ValueError("length of policy 'gen' must be at least 11, got %d" % length)
+    randomness = _RandomBytes()
+    passwords = [_format(policy, _generate(randomness, length, charsets)) for _ in range(n)]
+    if save:
+        method = '%s(%d)' % (policy, length) if policy != 'gen' else 'gen()'
+        _save_many((method, password) for password in passwords)
+    return passwords
 
 
 def gen():
     """
     随机生成长度为 16，带有数字、小写、大写、符号的密码
     """
-    chars = ''
-    while not _contain_all(chars, [digits, ascii_lowercase, ascii_uppercase]):
-        chars = ''.join(random.choices(
-            digits + ascii_lowercase + ascii_uppercase,
-            k=14
-        ))
-    password = '-'.join([chars[:5], chars[5:-5], chars[-5:]])
+    password, = generate_many(1, 'gen')
     print(password)
-    _save('gen()', password)
     return password
 
 
@@ -68,14 +203,8 @@ def complex(length=32):
     """
     随机生成指定长度（默认为 32）的复杂密码
     """
-    password = ''
-    while not _contain_all(password, [digits, ascii_lowercase, ascii_uppercase, punctuation]):
-        password = ''.join(random.choices(
-            digits + ascii_lowercase + ascii_uppercase + punctuation,
-            k=length
-        ))
+    password, = generate_many(1, 'complex', length)
     print(password)
-    _save('complex(%d)' % length, password)
     return password
 
 
@@ -83,30 +212,27 @@ def no_symbol(length=16):
     """
     随机生成指定长度（默认为 16），带有数字、小写、大写的密码
     """
-    password = ''
-    while not _contain_all(password, [digits, ascii_lowercase, ascii_uppercase]):
-        password = ''.join(random.choices(
-            digits + ascii_lowercase + ascii_uppercase,
-            k=length
-        ))
+    password, = generate_many(1, 'no_symbol', length)
     print(password)
-    _save('no_symbol(%d)' % length, password)
     return password
 
 
 def show_history():
     """
-    打印历史
+    打印 7 天内的历史，最新的在前
     """
-    # 加载已保存记录
+    connection = _connect()
     try:
-        saved = pickle.load(open(_HISTORY_PATH, 'rb'))
-    except (FileNotFoundError, pickle.UnpicklingError):
-        saved = []
-    for entry in sorted(saved, key=lambda e: e['time']):
-        print(entry['time'].isoformat(), entry['method'], sep='\t')
-        print(entry['password'])
-        print()
+        cursor = connection.execute(
+            'SELECT time, method, password FROM history WHERE time >= ? ORDER BY time DESC',
+            (time.time() - _RETENTION,),
+        )
+        for timestamp, method, password in cursor:
+            print(datetime.datetime.fromtimestamp(timestamp).isoformat(), method, sep='\t')
+            print(password)
+            print()
+    finally:
+        connection.close()
 
 
 def help():
@@ -114,8 +240,10 @@ def help():
     打印模块说明
     """
     print((bold + green)('%s: %s' % (__loader__.name, __doc__[1:-1])))
-    for func in [gen, complex, no_symbol, show_history]:
+    for func in [gen, complex, no_symbol, generate_many, show_history]:
         print(bold(func.__name__ + str(signature(func))) + func.__doc__)
 
 
-help()
+# 只在交互环境中导入时打印说明，批量生成时不产生输出
+if interactive():
+    help()
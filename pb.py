@@ -2,12 +2,24 @@
 
 from __future__ import annotations
 
+import atexit
+import json
+import math
 import os
+import signal
+import sys
+import threading
+import time
+import weakref
+from bisect import bisect_left
 from datetime import datetime, timedelta
-from typing import Any, Generator, Iterable
+from itertools import accumulate, islice
+from time import monotonic, perf_counter
+from typing import Any, Generator, Iterable, List, Optional
 import unicodedata
-from multipledispatch import dispatch
 
+import tracing
+from environment_check import live_output
 from styles import bggreen, bgwhite, black, inverse
 
 # 在 IPython 中使用白底黑字代替 inverse
@@ -18,31 +30,100 @@ except NameError:
     pass
 
 
+class _WidthTable(dict):
+    """字符 -> 显示宽度 的缓存，中文字符计两倍宽度"""
+
+    def __missing__(self, char: str) -> int:
+        width = self[char] = 2 if unicodedata.east_asian_width(char) == 'W' else 1
+        return width
+
+
+_char_width = _WidthTable().__getitem__
+
+
+def _text_width(text: str) -> int:
+    """字符串的显示宽度"""
+    if text.isascii():
+        return len(text)
+    return sum(map(_char_width, text))
+
+
 class _UnicodeStr(str):
     """中文字符计两倍宽度"""
 
-    def __init__(self, string: str) -> None:
-        self.char_widths = [
-            2 if unicodedata.east_asian_width(c) == 'W' else 1
-            for c in string
-        ]
-        self.len = sum(self.char_widths)
+    def _layout(self) -> Optional[List[int]]:
+        """
+        按需计算并缓存各字符的起始位置：offsets[i] 为前 i 个字符的总宽度
+        ASCII 字符串宽度即长度，返回 None
+        """
+        try:
+            return self._offsets
+        except AttributeError:
+            pass
+        if self.isascii():
+            offsets = None
+        else:
+            offsets = list(accumulate(map(_char_width, self), initial=0))
+        self._offsets = offsets
+        return offsets
 
     def __len__(self) -> int:
-        return self.len
+        offsets = self._layout()
+        return str.__len__(self) if offsets is None else offsets[-1]
 
     def __getitem__(self, key: slice) -> _UnicodeStr:
-        result = []
-        cumulate = 0
-        key = slice(
-            key.start or 0,
-            self.len if key.stop is None else key.stop,
-        )
-        for i, (c, w) in enumerate(zip(self, self.char_widths)):
-            if key.start <= cumulate < key.stop:
-                result.append(c)
-            cumulate += w
-        return _UnicodeStr(''.join(result))
+        """按显示宽度切片：保留起始位置在 [start, stop) 中的字符"""
+        offsets = self._layout()
+        start = max(0, key.start or 0)
+        stop = None if key.stop is None else max(0, key.stop)
+        if offsets is not None:
+            count = str.__len__(self)
+            start = bisect_left(offsets, start, 0, count)
+            stop = None if stop is None else max(start, bisect_left(offsets, stop, 0, count))
+        # 使用 str.__new__ 创建结果，宽度在需要时才计算
+        return str.__new__(_UnicodeStr, str.__getitem__(self, slice(start, stop)))
+
+    def cut(self, *positions: int) -> List[str]:
+        """
+        按显示宽度在若干位置（非负且递增）一次性切分，返回 len(positions) + 1 个普通字符串
+        等价于 [self[:p0], self[p0:p1], ..., self[pn:]]，但只需一次查找与原生切片
+        """
+        offsets = self._layout()
+        text = str.__str__(self)
+        if offsets is not None:
+            count = len(text)
+            positions = [bisect_left(offsets, position, 0, count) for position in positions]
+        return [text[begin:end] for begin, end in zip((0, *positions), (*positions, None))]
+
+
+# 控制台宽度缓存。能够监听 SIGWINCH 时缓存至窗口大小改变，否则最多缓存 _WIDTH_TTL 秒
+_width_cache = None
+_width_cache_time = 0.0
+_WIDTH_TTL = 1.0
+_watching_resize = False
+# 是否已经尝试注册 SIGWINCH 处理函数。只在第一次获取宽度时注册，导入 pb 不会改变进程的信号处理
+_resize_checked = False
+
+
+def _on_resize(signum, frame) -> None:
+    global _width_cache
+    _width_cache = None
+
+
+def _watch_resize() -> None:
+    """在主线程中、且 SIGWINCH 未被占用时注册处理函数；在其他线程中调用时留待之后再尝试"""
+    global _watching_resize, _resize_checked
+    if not hasattr(signal, 'SIGWINCH'):
+        _resize_checked = True
+        return
+    try:
+        if signal.getsignal(signal.SIGWINCH) in (signal.SIG_DFL, None):
+            signal.signal(signal.SIGWINCH, _on_resize)
+            _watching_resize = True
+        _resize_checked = True
+    except ValueError:
+        # 不在主线程中
+        pass
 
 
 def bar(text: str, progress: float) -> None:
@@ -50,7 +131,8 @@ def bar(text: str, progress: float) -> None:
     progress = min(1, max(0, progress))
     line = ProgressBar._pad_with_space(text)
     step = int(progress * ProgressBar._terminal_width() + .5)
-    print(inverse(line[:step]) + line[step:])
+    done, rest = line.cut(step)
+    print(inverse(done) + rest)
 
 
 def _format_int(value: int) -> str:
@@ -67,6 +149,13 @@ def _format_int(value: int) -> str:
             return '%.2f%s' % (value / lower, symbol)
 
 
+def _format_rate(rate: float) -> str:
+    """呈现每秒数量"""
+    if rate < 10:
+        return '%.2f' % rate
+    return _format_int(int(rate))
+
+
 def _format_duration(time: timedelta) -> str:
     """用 s,min,h 等形式呈现时长"""
     s = time.total_seconds()
@@ -89,9 +178,44 @@ class ProgressBar:
     ANIMATION_INTERVAL = timedelta(seconds=0.04)
     # 动画宽度
     ANIMATION_WIDTH = 6
+    # 后台绘制模式的默认帧率，也是封装迭代器时的目标刷新率
+    DEFAULT_FPS = 10
+    # 封装迭代器时，两次读取时钟之间最多间隔的数据个数
+    MAX_SAMPLE_INTERVAL = 1 << 20
+    # 两次速率采样之间的最短间隔（秒）
+    RATE_SAMPLE_INTERVAL = 0.1
+    # 速率指数平滑的时间常数（秒），越大越平滑
+    RATE_TIME_CONSTANT = 3.0
+    # 是否输出结构化记录而非刷新同一行：None 时在输出不是终端（且不在交互环境）时自动开启
+    STRUCTURED = None
+    # 结构化记录的格式，'json'（JSON lines）或 'text'
+    LOG_FORMAT = 'json'
+    # 两条结构化记录之间的最短间隔（秒）
+    LOG_INTERVAL = 10.0
+    # 结构化记录的输出流，None 为 sys.stdout
+    LOG_SINK = None
+
+    def __init__(self, label, fps: float = None, history: bool = False):
+        """
+        fps 为 None 时每次 update 立即绘制；
+        否则 update 只记录状态，由后台线程以不超过 fps 的帧率绘制，完成时立即绘制最终状态
 
-    def __init__(self, label):
+        history 为 True 时记录 (时间戳, 完成数量) 采样，运行结束后可从 self.history 读取，
+        用于事后分析吞吐量的变化
+        """
         self.label = label
+        self.fps = fps
+        # 等待后台线程绘制的状态：(绘制函数, 参数)
+        self._pending = None
+        self._renderer = None
+        self._render_lock = threading.Lock()
+        # 平滑后的速率（个/秒），保留至下一次运行开始采样
+        self.rate = None
+        self.history = [] if history else None
+        # 是否记录历史，在每次运行开始时生效
+        self._record_history = history
+        # 上一条结构化记录的时间
+        self._log_time = None
         self.reset()
 
     def reset(self, now: datetime = None):
@@ -100,106 +224,280 @@ class ProgressBar:
         self.last_progress = 0
         self.total = None
         self.start_time = now
+        # 下一次采样时重新开始计算速率与记录历史
+        self._sample_time = None
+        self._sample_completed = 0
+        # 已知的总数量（仅用于结构化记录）
+        self._display_total = None
+        # 输出模式在下一次输出时重新检测
+        self._structured = None
+
+    def _sample(self, completed: int, force: bool = False) -> None:
+        """采样完成数量，更新平滑速率并记录历史"""
+        now = perf_counter()
+        if self._sample_time is None:
+            # 新的一次运行
+            self.rate = None
+            self.history = [] if self._record_history else None
+        else:
+            elapsed = now - self._sample_time
+            if elapsed < ProgressBar.RATE_SAMPLE_INTERVAL and not force:
+                return
+            if elapsed > 0:
+                rate = (completed - self._sample_completed) / elapsed
+                if self.rate is None:
+                    self.rate = rate
+                else:
+                    alpha = 1 - math.exp(-elapsed / ProgressBar.RATE_TIME_CONSTANT)
+                    self.rate += alpha * (rate - self.rate)
+        self._sample_time = now
+        self._sample_completed = completed
+        if self.history is not None:
+            self.history.append((time.time(), completed))
+
+    def eta(self, completed: int = None, total: int = None) -> Optional[float]:
+        """按平滑速率估计的剩余时间（秒），无法估计时返回 None"""
+        completed = self.last_progress if completed is None else completed
+        total = total or self.total
+        if not total or not self.rate:
+            return None
+        return max(0, total - completed) / self.rate
 
     @staticmethod
     def _terminal_width() -> int:
-        """获取控制台宽度"""
+        """获取控制台宽度（带缓存）"""
+        global _width_cache, _width_cache_time
+        width = _width_cache
+        if width is not None and (_watching_resize or monotonic() - _width_cache_time < _WIDTH_TTL):
+            return width
+        if not _resize_checked:
+            _watch_resize()
         try:
-            return os.get_terminal_size()[0]
+            width = os.get_terminal_size()[0]
         except OSError:
-            return ProgressBar.DEFAULT_TERMINAL_WIDTH
+            width = ProgressBar.DEFAULT_TERMINAL_WIDTH
+        _width_cache = width
+        _width_cache_time = monotonic()
+        return width
 
     @staticmethod
     def _pad_with_space(text: str, append_text: str = None) -> _UnicodeStr:
         """将字符串填充空格以达到控制台宽度"""
-        text = _UnicodeStr(text)
+        padding = ProgressBar._terminal_width() - _text_width(text)
         if append_text is not None:
-            append_text = _UnicodeStr(append_text)
-            return _UnicodeStr(text + ' ' * (ProgressBar._terminal_width() - len(text) - len(append_text)) + append_text)
+            padding -= _text_width(append_text)
+            return _UnicodeStr(text + ' ' * padding + append_text)
         else:
-            return _UnicodeStr(text + ' ' * (ProgressBar._terminal_width() - len(text)))
+            return _UnicodeStr(text + ' ' * padding)
 
-    def _print(self, progress: float, text: str) -> None:
-        now = datetime.now()
+    def _compose(self, progress: float, text: str, now: datetime) -> str:
+        """生成带样式的一行进度条，宽度不超过控制台宽度"""
         append_text = _format_duration(now - self.start_time)
+        width = ProgressBar._terminal_width()
 
         # 显示 label
         if self.label:
             text = '%s: %s' % (self.label, text)
-        # 打印进度条
         if progress == 1:
-            # 已经完成，打印绿色的 done
+            # 已经完成，显示绿色的 done
             text += ' done'
-            print((bggreen + black)(ProgressBar._pad_with_space(text, append_text)))
-            self.reset(now)
-        else:
-            # 打印进度
             line = ProgressBar._pad_with_space(text, append_text)
-            progress_step = int(progress * ProgressBar._terminal_width() + .5)
-
-            animation_step = (
-                now - self.start_time - timedelta(seconds=3)
-            ) // ProgressBar.ANIMATION_INTERVAL
-            if animation_step > len(line) * 3 // 2:
-                animation_step = animation_step % (len(line) * 3 // 2) \
-                    - ProgressBar.ANIMATION_WIDTH
-            anchors = [
-                max(0, min(animation_step, progress_step)),
-                max(0, animation_step + ProgressBar.ANIMATION_WIDTH),
-                progress_step,
-            ]
-            if progress_step <= animation_step + ProgressBar.ANIMATION_WIDTH:
-                print(
-                    inverse(line[:anchors[0]]),
-                    line[anchors[0]:],
-                    sep='', end='\r',
-                )
+            if len(line) > width:
+                line = line[:width]
+            return (bggreen + black)(line)
+
+        line = ProgressBar._pad_with_space(text, append_text)
+        if len(line) > width:
+            line = line[:width]
+        progress_step = int(progress * width + .5)
+
+        animation_step = (
+            now - self.start_time - timedelta(seconds=3)
+        ) // ProgressBar.ANIMATION_INTERVAL
+        if animation_step > len(line) * 3 // 2:
+            animation_step = animation_step % (len(line) * 3 // 2) \
+                - ProgressBar.ANIMATION_WIDTH
+        anchors = [
+            max(0, min(animation_step, progress_step)),
+            max(0, animation_step + ProgressBar.ANIMATION_WIDTH),
+            progress_step,
+        ]
+        if progress_step <= animation_step + ProgressBar.ANIMATION_WIDTH:
+            head, tail = line.cut(anchors[0])
+            return inverse(head) + tail
+        head, animation, done, tail = line.cut(*anchors)
+        return inverse(head) + animation + inverse(done) + tail
+
+    def _print(self, progress: float, text: str) -> None:
+        with tracing.span('pb.render', 'pb'):
+            now = datetime.now()
+            line = self._compose(progress, text, now)
+            if progress == 1:
+                print(line)
+                self.reset(now)
             else:
-                print(
-                    inverse(line[:anchors[0]]),
-                    line[anchors[0]: anchors[1]],
-                    inverse(line[anchors[1]:anchors[2]]),
-                    line[anchors[2]:],
-                    sep='', end='\r'
-                )
-
-    @dispatch()
-    def update(self) -> None:
+                print(line, end='\r')
+
+    def _emit(self, final: bool, draw, *args) -> None:
+        """立即绘制，或在后台绘制模式中记录待绘制的状态"""
+        if self._structured is None:
+            self._structured = ProgressBar.STRUCTURED
+            if self._structured is None:
+                self._structured = not live_output(ProgressBar.LOG_SINK)
+        if self._structured:
+            self._log(final)
+        elif self.fps is None:
+            draw(*args)
+        elif final:
+            self._flush((draw, args))
+        else:
+            self._pending = (draw, args)
+            if self._renderer is None:
+                self._start_renderer()
+
+    def _log(self, final: bool) -> None:
+        """非终端输出：每隔 LOG_INTERVAL 秒（以及完成时）输出一条记录，输出量只与时长有关"""
+        now = monotonic()
+        if not final and self._log_time is not None and now - self._log_time < ProgressBar.LOG_INTERVAL:
+            return
+        self._log_time = now
+
+        elapsed = (datetime.now() - self.start_time).total_seconds()
+        eta = None if final else self.eta(self.last_progress, self._display_total)
+        record = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'label': self.label,
+            'completed': self.last_progress,
+            'total': self._display_total,
+            'rate': None if self.rate is None else round(self.rate, 3),
+            'eta': None if eta is None else round(eta, 3),
+            'elapsed': round(elapsed, 3),
+            'done': final,
+        }
+        if ProgressBar.LOG_FORMAT == 'json':
+            line = json.dumps(record, ensure_ascii=False)
+        else:
+            line = '[%s] %s: %s' % (record['time'], self.label, self.last_progress)
+            if self._display_total:
+                line += '/%s (%.1f%%)' % (self._display_total, self.last_progress / self._display_total * 100)
+            if self.rate is not None:
+                line += ', %s/s' % _format_rate(self.rate)
+            if record['eta'] is not None:
+                line += ', ETA %s' % _format_duration(timedelta(seconds=record['eta']))
+            line += ', elapsed %s' % _format_duration(timedelta(seconds=elapsed))
+            if final:
+                line += ' done'
+
+        sink = ProgressBar.LOG_SINK or sys.stdout
+        with tracing.span('pb.log', 'pb'):
+            sink.write(line + '\n')
+            sink.flush()
+        if final:
+            self._log_time = None
+            self.reset()
+
+    def _start_renderer(self) -> None:
+        stop = threading.Event()
+        self._renderer = stop
+        _active_bars.add(self)
+        threading.Thread(target=self._render_loop, args=(stop, 1 / self.fps), daemon=True).start()
+
+    def _render_loop(self, stop: threading.Event, interval: float) -> None:
+        """后台线程：每帧绘制一次最新状态"""
+        while not stop.wait(interval):
+            with self._render_lock:
+                pending, self._pending = self._pending, None
+                if pending is not None and not stop.is_set():
+                    pending[0](*pending[1])
+
+    def _flush(self, final=None) -> None:
+        """停止后台线程，并绘制最终状态（未指定时绘制尚未绘制的状态）"""
+        with self._render_lock:
+            pending, self._pending = self._pending, None
+            if self._renderer is not None:
+                self._renderer.set()
+                self._renderer = None
+                _active_bars.discard(self)
+            pending = final or pending
+            if pending is not None:
+                pending[0](*pending[1])
+
+    def update(self, *args) -> None:
+        """
+        更新进度条，按参数分派：
+            update()                     计数器自增
+            update(progress: float)      更新完成度（0 至 1）
+            update(completed: int)       更新完成数量，总数量未知
+            update(completed: int, total: int)  更新完成数量，已知总数量
+        """
+        if not args:
+            return self._increment()
+        if len(args) == 1:
+            if isinstance(args[0], int):
+                return self._update_count(args[0])
+            if isinstance(args[0], float):
+                return self._update_progress(args[0])
+        elif len(args) == 2 and isinstance(args[0], int) and isinstance(args[1], int):
+            return self._update_total(*args)
+        raise TypeError('unsupported argument type(s) for update: %s' %
+                        ', '.join(type(arg).__name__ for arg in args))
+
+    def set_count(self, completed: int, total: int = None) -> None:
+        """更新完成数量，不经过参数分派；total 为 None 表示总数量未知"""
+        if total:
+            self._update_total(completed, total)
+        else:
+            self._update_count(completed)
+
+    def _increment(self) -> None:
         """计数器自增"""
         self.last_progress += 1
         if self.total:
-            self.update(self.last_progress, self.total)
+            self._update_total(self.last_progress, self.total)
         else:
-            self.update(self.last_progress)
+            self._update_count(self.last_progress)
 
-    @dispatch(float)
-    def update(self, progress: float) -> None:
+    def _update_progress(self, progress: float) -> None:
         """更新完成度（0 至 1）"""
         if progress == 0 or progress < self.last_progress:
             self.reset()
         self.last_progress = progress
+        self._emit(progress >= 1, self._draw_progress, progress)
 
+    def _draw_progress(self, progress: float) -> None:
         text = '%s%%' % (str(progress * 100)[:4])
         self._print(progress, text)
 
-    @dispatch(int)
-    def update(self, completed: int) -> None:
+    def _update_count(self, completed: int) -> None:
         """更新完成数量，总数量未知"""
         if completed == 0 or completed < self.last_progress:
             self.reset()
         self.last_progress = completed
+        self._sample(completed)
+        self._emit(False, self._draw_count, completed)
 
+    def _draw_count(self, completed: int) -> None:
         text = str(completed)
+        if self.rate is not None:
+            text = '%s (%s/s)' % (text, _format_rate(self.rate))
         self._print(1 - 1e-10, text)
 
-    @dispatch(int, int)
-    def update(self, completed: int, total: int) -> None:
+    def _update_total(self, completed: int, total: int) -> None:
         """更新完成数量，已知总数量"""
         if completed == 0 or completed < self.last_progress:
             self.reset()
         self.last_progress = completed
+        self._display_total = total
+        self._sample(completed, completed >= total)
+        self._emit(completed >= total, self._draw_total, completed, total)
 
+    def _draw_total(self, completed: int, total: int) -> None:
         text = '%s/%s' % (_format_int(completed), _format_int(total))
+        if self.rate is not None:
+            text = '%s, %s/s' % (text, _format_rate(self.rate))
+            eta = self.eta(completed, total)
+            if eta is not None and completed < total:
+                text = '%s, ETA %s' % (text, _format_duration(timedelta(seconds=eta)))
         progress = completed / total
         text = '%s%% (%s)' % (str(progress * 100)[:4], text)
         self._print(progress, text)
@@ -215,15 +513,24 @@ class ProgressBar:
             return
         if self.total and self.last_progress >= self.total:
             return
-        self._print(1, str(self.last_progress))
+        self._emit(True, self._print, 1, str(self.last_progress))
+
+    def __call__(self, iterable: Iterable, *args, **kwargs):
+        """
+        pb(iterable, ...) 封装迭代器；pb(total: int) 指定总数，用于 with 语句
+        """
+        if isinstance(iterable, int):
+            return self._set_total(iterable)
+        return self._iterate(iterable, *args, **kwargs)
 
-    @dispatch(object)
-    def __call__(
+    def _iterate(
         self,
         iterable: Iterable,
         size: int = None,
         label: str = None,
         interval: int = None,
+        fps: float = None,
+        history: bool = None,
     ) -> Generator[Any, None, None]:
         """
         封装一个集合或迭代器，返回一个迭代器，在每次取出物件时更新进度条
@@ -241,36 +548,217 @@ class ProgressBar:
                 进度条显示的标签
 
             interval: int = None
-                显示更新的间隔。如果数据长度确定，则间隔不会小于数据长度的万分之一
+                固定的显示更新间隔（数据个数）。如果数据长度确定，则间隔不会小于数据长度的千分之一
+                为 None 时根据观测到的速率自适应：每隔 N 个数据读取一次时钟，使刷新间隔约为一帧
+
+            fps: float = None
+                指定时使用后台绘制模式，见 ProgressBar.__init__
+
+            history: bool = None
+                指定时开启或关闭历史记录，见 ProgressBar.__init__。记录的历史在结束后仍可读取
         """
-        self.reset()
-        self.label = label or self.label or type(iterable).__qualname__
-        interval = interval or 1
+        # fps、history 只在本次调用中生效，结束后恢复（pb 是共用的实例）
+        saved = self.fps, self._record_history
+        if fps is not None:
+            self.fps = fps
+        if history is not None:
+            self._record_history = history
+        try:
+            self.reset()
+            self.label = label or self.label or type(iterable).__qualname__
 
-        if hasattr(iterable, '__len__'):
-            size = len(iterable)
-        elif size is not None and size <= 0:
-            iterable = list(iterable)
-            size = len(iterable)
+            if hasattr(iterable, '__len__'):
+                size = len(iterable)
+            elif size is not None and size <= 0:
+                iterable = list(iterable)
+                size = len(iterable)
 
+            if interval:
+                yield from self._iterate_fixed(iterable, size, interval)
+            else:
+                yield from self._iterate_sampled(iterable, size)
+            if size:
+                self._update_total(size, size)
+        finally:
+            # 总数未知或提前结束时没有最终状态，停止后台绘制线程
+            self._flush()
+            self.fps, self._record_history = saved
+
+    def _iterate_fixed(self, iterable: Iterable, size: Optional[int], interval: int) -> Generator[Any, None, None]:
+        """每 interval 个数据更新一次进度"""
         if size is None:
             for i, item in enumerate(iterable):
                 yield item
                 if i % interval == 0:
-                    self.update(i, 0)
+                    self._update_count(i)
         else:
             interval = max(interval, size // 1000)
             for i, item in enumerate(iterable):
                 yield item
                 if i % interval == 0:
-                    self.update(i, size)
-            self.update(size, size)
+                    self._update_total(i, size)
 
-    @dispatch(int)
-    def __call__(self, total: int):
+    def _iterate_sampled(self, iterable: Iterable, size: Optional[int]) -> Generator[Any, None, None]:
+        """
+        每批 batch 个数据之间不做任何检查，批次结束时读取时钟并更新进度
+        batch 从 1 开始，按观测速率调整为约一帧时间内的数据量（每次最多翻倍），
+        因此单个数据的额外开销接近裸 for 循环
+        """
+        frame = 1 / (self.fps or ProgressBar.DEFAULT_FPS)
+        iterator = iter(iterable)
+        # 总数未知时需要逐个计数，总数已知时按批次计数
+        counter = None if size is not None else enumerate(iterator, 1)
+        end = object()
+        batch = 1
+        count = 0
+        last = perf_counter()
+        while True:
+            if counter is None:
+                yield from islice(iterator, batch)
+                # 取出下一个数据以判断是否已经结束
+                item = next(iterator, end)
+                if item is end:
+                    return
+                count += batch + 1
+                yield item
+                # 完成状态由 _iterate 在迭代结束后给出
+                self._update_total(min(count, size - 1), size)
+            else:
+                previous = count
+                for count, item in islice(counter, batch):
+                    yield item
+                self._update_count(count)
+                if count - previous < batch:
+                    return
+            now = perf_counter()
+            elapsed = now - last
+            last = now
+            target = int(batch * frame / elapsed) if elapsed > 0 else batch * 2
+            batch = max(1, min(batch * 2, target, ProgressBar.MAX_SAMPLE_INTERVAL))
+
+    def _set_total(self, total: int) -> ProgressBar:
         """指定总数，用于 with 语句"""
         self.total = total
         return self
 
 
+class _ManagedBar(ProgressBar):
+    """由 MultiProgress 统一绘制的进度条：update 只记录状态，绘制结果保存在 self.line"""
+
+    def __init__(self, label: str, manager: MultiProgress) -> None:
+        self._manager = manager
+        self.line = ''
+        super().__init__(label)
+
+    def _emit(self, final: bool, draw, *args) -> None:
+        if self._manager.structured:
+            self._log(final)
+        else:
+            self._pending = (draw, args)
+            if final:
+                # 完成状态可能在下一帧之前被 reset 覆盖，立即生成
+                self._manager._render_bar(self)
+
+    def _print(self, progress: float, text: str) -> None:
+        with tracing.span('pb.render', 'pb'):
+            now = datetime.now()
+            self.line = self._compose(progress, text, now)
+            if progress == 1:
+                self.reset(now)
+
+
+class MultiProgress:
+    """
+    同时显示多个进度条（如每个流水线阶段、每个 worker 各一个）
+
+    各进度条的 update 只记录状态；后台线程以 fps 帧率生成所有进度条，
+    并通过光标移动一次性写出整块内容，因此进度条之间不会互相覆盖。
+    输出不是终端时，各进度条分别输出结构化记录（见 ProgressBar.STRUCTURED）
+
+    用法：
+        with MultiProgress() as bars:
+            for item in bars['stage 1'](data):
+                ...
+            bars['stage 2'].update(3, 10)
+    """
+
+    def __init__(self, fps: float = ProgressBar.DEFAULT_FPS, stream=None) -> None:
+        self.fps = fps
+        self.stream = stream or sys.stdout
+        self.bars = {}
+        structured = ProgressBar.STRUCTURED
+        if structured is None:
+            structured = not live_output(self.stream)
+        self.structured = structured
+        self._lock = threading.RLock()
+        # 上一帧写出的行数，下一帧先将光标上移同样的行数
+        self._drawn = 0
+        self._stop = None
+
+    def bar(self, name: str, label: str = None) -> ProgressBar:
+        """获取（或创建）名为 name 的进度条"""
+        with self._lock:
+            if name not in self.bars:
+                self.bars[name] = _ManagedBar(name if label is None else label, self)
+                if self._stop is None and not self.structured:
+                    self._start()
+            return self.bars[name]
+
+    __getitem__ = bar
+
+    def _start(self) -> None:
+        self._stop = threading.Event()
+        threading.Thread(target=self._render_loop, args=(self._stop, 1 / self.fps), daemon=True).start()
+
+    def _render_loop(self, stop: threading.Event, interval: float) -> None:
+        while not stop.wait(interval):
+            self.refresh()
+
+    def _render_bar(self, bar: _ManagedBar) -> None:
+        with self._lock:
+            pending, bar._pending = bar._pending, None
+            if pending is not None:
+                pending[0](*pending[1])
+
+    def refresh(self) -> None:
+        """生成并写出一帧"""
+        with self._lock:
+            bars = list(self.bars.values())
+            if not bars or self.structured:
+                return
+            for bar in bars:
+                self._render_bar(bar)
+            # 回到上一帧的第一行，逐行清除并重写
+            frame = ['\x1b[%dF' % self._drawn] if self._drawn else []
+            frame += ['\x1b[2K%s\n' % bar.line for bar in bars]
+            with tracing.span('pb.write', 'pb'):
+                self.stream.write(''.join(frame))
+                self.stream.flush()
+            self._drawn = len(bars)
+
+    def close(self) -> None:
+        """停止后台线程并写出最后一帧"""
+        with self._lock:
+            if self._stop is not None:
+                self._stop.set()
+                self._stop = None
+            self.refresh()
+
+    def __enter__(self) -> MultiProgress:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+# 使用后台绘制模式、尚未完成的进度条，退出时绘制其最终状态
+_active_bars = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_active_bars() -> None:
+    for bar in list(_active_bars):
+        bar._flush()
+
+
 pb = ProgressBar('')
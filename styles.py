@@ -4,24 +4,43 @@ from __future__ import annotations
 from typing import Union, Iterable
 
 
+def _color_default() -> bool:
+    """设置了 NO_COLOR 环境变量，或标准输出既不是终端也不是交互环境时，不输出格式"""
+    import os
+    from environment_check import live_output
+    return 'NO_COLOR' not in os.environ and live_output()
+
+
+# 为 False 时所有样式直接返回原字符串
+_enabled = _color_default()
+
+
+def set_color(enabled: bool = True) -> None:
+    """开启或关闭所有样式"""
+    global _enabled
+    _enabled = enabled
+
+
+def color_enabled() -> bool:
+    """当前是否输出格式"""
+    return _enabled
+
+
 class _Style:
     def __init__(self, name: str, on: int, off: int = 0):
         self.name = name
         self.on = on
         self.off = off
-
-    @property
-    def enter(self) -> str:
-        return '\x1b[%dm' % self.on
-        
-    @property
-    def exit(self) -> str:
-        return '\x1b[%dm' % self.off
+        # 转义序列只在创建时生成一次
+        self.enter = '\x1b[%dm' % on
+        self.exit = '\x1b[%dm' % off
 
     def __str__(self) -> str:
         return '%s style (%d, %d)' % (self(self.name), self.on, self.off)
 
     def __call__(self, string: str) -> str:
+        if not _enabled:
+            return string
         return self.enter + string + self.exit
 
     def __add__(self, other: Union[_Style, _CombinedStyle]) -> _CombinedStyle:
@@ -35,15 +54,18 @@ class _Style:
 
 class _CombinedStyle:
     def __init__(self, styles: Iterable[_Style]):
-        self.styles = styles
+        self.styles = list(styles)
+        # 合并为一个 SGR 序列，如 \x1b[1;32m，关闭时重复的代码只出现一次
+        self.enter = '\x1b[%sm' % ';'.join(str(style.on) for style in self.styles)
+        self.exit = '\x1b[%sm' % ';'.join(str(off) for off in dict.fromkeys(style.off for style in reversed(self.styles)))
 
     def __str__(self) -> str:
         return self(' + '.join(style.name for style in self.styles)) + ' styles'
     
     def __call__(self, string: str) -> str:
-        for style in self.styles:
-            string = style(string)
-        return string
+        if not _enabled:
+            return string
+        return self.enter + string + self.exit
 
     def __add__(self, other: Union[_Style, _CombinedStyle]) -> _CombinedStyle:
         if isinstance(other, _Style):
@@ -0,0 +1,265 @@
+"""
+性能追踪：记录命名的时间区间（span）的墙上时间与 CPU 时间
+
+mp、pb、logger 的内部环节会自动记录 span；worker 中的 span 经日志转发的队列汇总到主进程。
+mp.map 等在进程池结束时、Scheduler（包括 mp.shared()）在每个 chunk 结束后发送；
+mp.imap 的进程池不会被关闭，其 worker 中的 span 只按 FLUSH_SIZE 分批发送，最后不足一批的部分不会汇总
+未开启时，span() 返回共用的空对象，埋点处只有一次全局变量判断
+
+用法：
+    import tracing
+    tracing.enable()
+
+    with tracing.span('load'):
+        ...
+
+    @tracing.traced
+    def step(x):
+        ...
+
+    tracing.summary()
+    tracing.export_chrome('trace.json')
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List
+
+# 是否记录，埋点处直接读取该变量
+ENABLED = False
+# worker 中积累多少个 span 后发送一次；其余在 worker 正常退出时发送
+FLUSH_SIZE = 256
+
+# 已记录的 span：(名称, 分类, 开始时间戳, 墙上时间, CPU 时间, 进程号, 线程号, worker 编号)
+_spans = []
+_lock = threading.Lock()
+# worker 中：发送 span 的队列与 worker 编号
+_transport = None
+_worker = None
+# 主进程中：等待接收线程处理完队列中已有记录的事件
+_sync_events = {}
+
+
+def enable() -> None:
+    """开始记录。之后创建的进程池中的 worker 也会记录"""
+    global ENABLED
+    ENABLED = True
+
+
+def disable() -> None:
+    """停止记录，已记录的 span 保留"""
+    global ENABLED
+    ENABLED = False
+
+
+def reset() -> None:
+    """清除已记录的 span"""
+    with _lock:
+        _spans.clear()
+
+
+def start() -> tuple:
+    """开始计时，与 stop 配合使用；埋点处应先判断 ENABLED"""
+    return time.time(), time.perf_counter(), time.thread_time()
+
+
+def stop(started: tuple, name: str, category: str = 'user') -> None:
+    """结束计时并记录"""
+    wall = time.perf_counter() - started[1]
+    cpu = time.thread_time() - started[2]
+    _spans.append((name, category, started[0], wall, cpu, os.getpid(), threading.get_ident(), _worker))
+    if _transport is not None and len(_spans) >= FLUSH_SIZE:
+        _send()
+
+
+class _Span:
+    __slots__ = ('name', 'category', 'started')
+
+    def __init__(self, name: str, category: str) -> None:
+        self.name = name
+        self.category = category
+
+    def __enter__(self) -> '_Span':
+        self.started = start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        stop(self.started, self.name, self.category)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, category: str = 'user'):
+    """
+    记录一个 span 的 context manager；未开启时返回共用的空对象
+
+        with tracing.span('parse', 'io'):
+            ...
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name, category)
+
+
+def traced(name=None, category: str = 'function'):
+    """
+    装饰器：每次调用记录一个 span，名称默认为函数的 qualname。是否记录在调用时判断
+
+        @tracing.traced
+        def f(): ...
+
+        @tracing.traced('load', 'io')
+        def g(): ...
+    """
+    def decorate(function: Callable) -> Callable:
+        label = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            started = start()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stop(started, label, category)
+        return wrapper
+
+    if callable(name):
+        function, name = name, None
+        return decorate(function)
+    return decorate
+
+
+# 多进程：worker 中的 span 通过日志转发的队列发送给主进程
+_SPANS, _SYNC = 'spans', 'sync'
+
+
+def forward(queue, worker: int = None) -> None:
+    """
+    在 worker 进程中调用：开启记录，之后的 span 分批发送到 queue
+    worker 正常退出（进程池 close + join）时发送剩余的 span；Scheduler 的 worker 在每个 chunk 结束后发送
+    """
+    global ENABLED, _transport, _worker
+    from multiprocess.util import Finalize
+
+    ENABLED = True
+    _transport = queue
+    _worker = worker
+    # fork 得到的主进程记录不属于该 worker
+    _spans.clear()
+    Finalize(None, _send, exitpriority=10)
+
+
+def _flush() -> None:
+    """在 worker 中调用：立即发送已记录的 span，用于不会关闭的进程池"""
+    if _transport is not None:
+        _send()
+
+
+def _send() -> None:
+    if _spans:
+        spans = _spans[:]
+        del _spans[:len(spans)]
+        _transport.put((_SPANS, spans))
+
+
+def _receive(record) -> None:
+    """主进程的接收线程调用"""
+    if record[0] == _SPANS:
+        with _lock:
+            _spans.extend(record[1])
+    else:
+        event = _sync_events.pop(record[1], None)
+        if event is not None:
+            event.set()
+
+
+def _sync(timeout: float = 1) -> None:
+    """等待接收线程处理完队列中已有的记录（即已经退出的 worker 发送的 span）"""
+    import logger
+    inbox = logger._inbox
+    if inbox is None:
+        return
+    event = threading.Event()
+    token = id(event)
+    _sync_events[token] = event
+    inbox.put((_SYNC, token))
+    event.wait(timeout)
+
+
+def spans() -> List[tuple]:
+    """所有已记录的 span（包括已汇总的 worker 的 span）"""
+    _sync()
+    with _lock:
+        return list(_spans)
+
+
+def stats() -> List[Dict[str, Any]]:
+    """按名称汇总：次数、总墙上时间、平均、最大、总 CPU 时间，按总墙上时间降序"""
+    table = {}
+    for name, category, _, wall, cpu, pid, _, _ in spans():
+        row = table.get(name)
+        if row is None:
+            row = table[name] = {
+                'name': name, 'category': category, 'count': 0,
+                'wall': 0.0, 'max': 0.0, 'cpu': 0.0, 'processes': set(),
+            }
+        row['count'] += 1
+        row['wall'] += wall
+        row['cpu'] += cpu
+        if wall > row['max']:
+            row['max'] = wall
+        row['processes'].add(pid)
+    rows = sorted(table.values(), key=lambda row: row['wall'], reverse=True)
+    for row in rows:
+        row['mean'] = row['wall'] / row['count']
+        row['processes'] = len(row['processes'])
+    return rows
+
+
+def summary(file=None) -> None:
+    """打印汇总表，时间单位为毫秒；worker 中的 span 在各进程分别计时，总和可能超过实际耗时"""
+    file = file or sys.stdout
+    rows = stats()
+    width = max([len(row['name']) for row in rows] + [4])
+    print('%-*s %8s %12s %10s %10s %12s %5s' % (width, 'span', 'count', 'total ms', 'mean ms', 'max ms', 'cpu ms', 'proc'), file=file)
+    for row in rows:
+        print('%-*s %8d %12.3f %10.3f %10.3f %12.3f %5d' % (
+            width, row['name'], row['count'], row['wall'] * 1e3, row['mean'] * 1e3,
+            row['max'] * 1e3, row['cpu'] * 1e3, row['processes'],
+        ), file=file)
+
+
+def export_chrome(path: str) -> None:
+    """
+    导出为 Chrome trace event 格式（chrome://tracing、Perfetto 可打开），每个进程、线程一行
+    """
+    events = []
+    names = {}
+    for name, category, started, wall, cpu, pid, tid, worker in spans():
+        events.append({
+            'name': name, 'cat': category, 'ph': 'X',
+            'ts': started * 1e6, 'dur': wall * 1e6,
+            'pid': pid, 'tid': tid, 'args': {'cpu_ms': cpu * 1e3},
+        })
+        names.setdefault(pid, 'main' if worker is None else 'worker %s' % worker)
+    for pid, name in names.items():
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file, ensure_ascii=False)